@@ -0,0 +1,492 @@
+"""A local stand-in for the tablet's ssh server, for the benchmarks"""
+import json
+import os
+import random
+import shlex
+import socket
+import struct
+import subprocess
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+import uuid
+
+import paramiko
+from paramiko.sftp_server import SFTPServer
+
+DEVICE_ROOTS = ('/home/root', '/usr/share/remarkable')
+PASSWORD = 'fake-tablet'
+CHUNK = 32768
+EPOCH = 1500000000
+
+CONFIG = '''[General]
+DeveloperPassword=%s
+IdleSuspendDelay=1200000
+SuspendPowerOffDelay=3600000
+wifion=true
+'''
+
+
+class Stats(object):
+    """Counters shared by the server, its channels and the link"""
+
+    def __init__(self):
+        """Initialize the class"""
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero everything"""
+        with self._lock:
+            self.counts = dict(
+                connections=0, channels=0, sftp_requests=0,
+                exec_commands=0, bytes_up=0, bytes_down=0
+            )
+
+    def add(self, name, amount=1):
+        """Bump one counter"""
+        with self._lock:
+            self.counts[name] += amount
+
+    def snapshot(self):
+        """Copy of the counters"""
+        with self._lock:
+            return dict(self.counts)
+
+
+class FakeSFTPHandle(paramiko.SFTPHandle):
+    """Open local file, paramiko does the reads and writes"""
+
+    def stat(self):
+        """Attributes of the open file"""
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.fileno))
+
+    def chattr(self, attr):
+        """Accept attribute changes, only the times matter"""
+        return paramiko.SFTP_OK
+
+
+class FakeSFTPServer(paramiko.SFTPServerInterface):
+    """Maps the tablet's absolute paths under a local root"""
+
+    def __init__(self, server, root, *args, **kwargs):
+        """Initialize the class"""
+        super(FakeSFTPServer, self).__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        """Local path for a tablet path"""
+        return self.root + '/' + self.canonicalize(path).lstrip('/')
+
+    def canonicalize(self, path):
+        """Everything is relative to /"""
+        return os.path.normpath('/' + path.lstrip('/'))
+
+    def list_folder(self, path):
+        """listdir_attr"""
+        local = self._local(path)
+        try:
+            listing = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(
+                    os.stat(os.path.join(local, name))
+                )
+                attr.filename = name
+                listing.append(attr)
+            return listing
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+
+    def stat(self, path):
+        """stat"""
+        try:
+            return paramiko.SFTPAttributes.from_stat(
+                os.stat(self._local(path))
+            )
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        """Open for reading or writing"""
+        local = self._local(path)
+        try:
+            fileno = os.open(local, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = FakeSFTPHandle(flags)
+        handle.fileno = fileno
+        handle.filename = local
+        handle.readfile = handle.writefile = os.fdopen(fileno, mode)
+        return handle
+
+    def remove(self, path):
+        """rm"""
+        try:
+            os.remove(self._local(path))
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        """mv"""
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        """mkdir"""
+        try:
+            os.mkdir(self._local(path))
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        """rmdir"""
+        try:
+            os.rmdir(self._local(path))
+        except OSError as error:
+            return SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        """utime, the rest is ignored"""
+        if attr.st_atime is not None and attr.st_mtime is not None:
+            os.utime(self._local(path), (attr.st_atime, attr.st_mtime))
+        return paramiko.SFTP_OK
+
+
+class CountingSFTPServer(SFTPServer):
+    """SFTP subsystem that counts every request it answers"""
+
+    def __init__(self, channel, name, server, sftp_si, stats=None, **kwargs):
+        """Initialize the class"""
+        super(CountingSFTPServer, self).__init__(
+            channel, name, server, sftp_si, **kwargs
+        )
+        self.stats = stats
+
+    def _process(self, t, request_number, msg):
+        """One request from the client"""
+        self.stats.add('sftp_requests')
+        return super(CountingSFTPServer, self)._process(
+            t, request_number, msg
+        )
+
+
+class FakeServer(paramiko.ServerInterface):
+    """Password auth, sessions, exec and the sftp subsystem"""
+
+    def __init__(self, root, stats):
+        """Initialize the class"""
+        self.root = root
+        self.stats = stats
+
+    def get_allowed_auths(self, username):
+        """Password only, like the tablet"""
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        """root with the configured password"""
+        if username == 'root' and password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        """Sessions only"""
+        if kind != 'session':
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        self.stats.add('channels')
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        """Run the command against the local root on its own thread"""
+        self.stats.add('exec_commands')
+        thread = Thread(
+            target=self._exec, args=(channel, command.decode('utf-8'))
+        )
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _to_local(self, text):
+        """Point the tablet's paths at the local root"""
+        for device_root in DEVICE_ROOTS:
+            text = text.replace(device_root, self.root + device_root)
+        return text
+
+    def _to_device(self, text):
+        """And back again for anything printed"""
+        return text.replace(self.root + '/', '/')
+
+    def _exec(self, channel, command):
+        """sh -s gets its script rewritten, the rest streams raw"""
+        try:
+            process = subprocess.Popen(
+                self._to_local(command),
+                shell=True,
+                cwd=self.root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            if shlex.split(command) == ['sh', '-s']:
+                script = channel.makefile('rb').read().decode('utf-8')
+                stdout, stderr = process.communicate(
+                    self._to_local(script).encode('utf-8')
+                )
+                channel.sendall(self._to_device(stdout.decode('utf-8'))
+                                .encode('utf-8'))
+            else:
+                feeder = Thread(target=self._feed, args=(channel, process))
+                feeder.daemon = True
+                feeder.start()
+                for chunk in iter(lambda: process.stdout.read(CHUNK), b''):
+                    channel.sendall(chunk)
+                stderr = process.stderr.read()
+                process.wait()
+            channel.sendall_stderr(stderr)
+            channel.send_exit_status(process.returncode)
+        except (EOFError, socket.error):
+            pass
+        finally:
+            # A quick command can finish before the reply to the exec
+            # request goes out, closing now would fail it on the client,
+            # which closes the channel itself once it has read everything
+            try:
+                channel.shutdown_write()
+            except (EOFError, socket.error):
+                pass
+
+    def _feed(self, channel, process):
+        """Pass whatever the client sends on to the command's stdin"""
+        try:
+            for chunk in iter(lambda: channel.recv(CHUNK), b''):
+                process.stdin.write(chunk)
+            process.stdin.close()
+        except (EOFError, IOError, socket.error):
+            pass
+
+
+class Link(object):
+    """TCP relay that adds a one way delay and a bandwidth cap"""
+
+    def __init__(self, target, stats, latency=0.0, bandwidth=None):
+        """Initialize the class, latency is the round trip in seconds"""
+        self.target = target
+        self.stats = stats
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(8)
+        self.address = self._listener.getsockname()
+        thread = Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        """Relay every connection"""
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except socket.error:
+                return
+            server = socket.create_connection(self.target)
+            for each in (client, server):
+                each.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, sink, counter in ((client, server, 'bytes_up'),
+                                          (server, client, 'bytes_down')):
+                self._relay(source, sink, counter)
+
+    def _relay(self, source, sink, counter):
+        """Reader stamps each chunk, writer releases it when it is due"""
+        pending = []
+        ready = Event()
+        lock = Lock()
+
+        def read():
+            """Receive as fast as the kernel hands it over"""
+            while True:
+                try:
+                    data = source.recv(CHUNK)
+                except socket.error:
+                    data = b''
+                with lock:
+                    pending.append((time.time() + self.latency / 2, data))
+                ready.set()
+                if not data:
+                    return
+
+        def write():
+            """Hold each chunk for the delay and pace it to the bandwidth"""
+            free_at = 0.0
+            while True:
+                ready.wait()
+                with lock:
+                    due, data = pending.pop(0)
+                    if not pending:
+                        ready.clear()
+                if not data:
+                    try:
+                        sink.shutdown(socket.SHUT_WR)
+                    except socket.error:
+                        pass
+                    return
+                if self.bandwidth:
+                    free_at = max(free_at, time.time()) + \
+                        len(data) / float(self.bandwidth)
+                    due = max(due, free_at)
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                self.stats.add(counter, len(data))
+                try:
+                    sink.sendall(data)
+                except socket.error:
+                    return
+
+        for target in (read, write):
+            thread = Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        """Stop accepting"""
+        self._listener.close()
+
+
+class FakeTablet(object):
+    """In process ssh server on localhost seeded like a tablet"""
+
+    def __init__(self, root, latency=0.0, bandwidth=None):
+        """Initialize the class, bandwidth in bytes per second"""
+        self.root = os.path.abspath(root)
+        self.stats = Stats()
+        self.password = PASSWORD
+        self._key = paramiko.RSAKey.generate(2048)
+        self._listener = socket.socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(8)
+        self._transports = []
+        thread = Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+        self.link = Link(
+            self._listener.getsockname(), self.stats, latency, bandwidth
+        )
+        self.host, self.port = self.link.address
+
+    def _accept(self):
+        """One transport per connection"""
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except socket.error:
+                return
+            self.stats.add('connections')
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._key)
+            transport.use_compression(True)
+            transport.set_subsystem_handler(
+                'sftp', CountingSFTPServer, FakeSFTPServer,
+                root=self.root, stats=self.stats
+            )
+            transport.start_server(server=FakeServer(self.root, self.stats))
+            self._transports.append(transport)
+
+    def close(self):
+        """Shut everything down"""
+        self.link.close()
+        self._listener.close()
+        for transport in self._transports:
+            transport.close()
+
+    def __enter__(self):
+        """Context manager"""
+        return self
+
+    def __exit__(self, *args):
+        """Context manager"""
+        self.close()
+
+
+def _page(rng, size):
+    """Something shaped like a .rm file, pen points drifting across a page"""
+    data = [b'reMarkable .lines file, version=3          ']
+    length = len(data[0])
+    x, y = 700.0, 900.0
+    while length < size:
+        x += rng.uniform(-2, 2)
+        y += rng.uniform(-2, 2)
+        data.append(struct.pack('<6f', x, y, 0.3, 0.0, 2.0, 0.8))
+        length += 24
+    return b''.join(data)[:size]
+
+
+def _write(path, data, mtime=EPOCH):
+    """Write a file with a fixed mtime, making the parents as needed"""
+    parent = os.path.dirname(path)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    with open(path, 'wb') as output:
+        output.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+def seed(root, documents=100, pages=5, page_size=20000, seed_value=0):
+    """Fill root with a synthetic xochitl tree, config, templates, splash"""
+    rng = random.Random(seed_value)
+    xochitl = root + '/home/root/.local/share/remarkable/xochitl'
+    folders = [''] + [
+        str(uuid.UUID(int=rng.getrandbits(128)))
+        for _ in range(max(1, documents // 10))
+    ]
+    for number, folder in enumerate(folders[1:]):
+        _write(xochitl + '/' + folder + '.metadata', json.dumps({
+            'visibleName': 'Folder %d' % number,
+            'type': 'CollectionType',
+            'parent': '',
+            'lastModified': str(EPOCH * 1000)
+        }).encode('utf-8'))
+        _write(xochitl + '/' + folder + '.content', b'{}')
+    for number in range(documents):
+        key = str(uuid.UUID(int=rng.getrandbits(128)))
+        base = xochitl + '/' + key
+        _write(base + '.metadata', json.dumps({
+            'visibleName': 'Notebook %d' % number,
+            'type': 'DocumentType',
+            'parent': rng.choice(folders),
+            'lastModified': str(EPOCH * 1000)
+        }).encode('utf-8'))
+        _write(base + '.content', json.dumps({
+            'fileType': '', 'pageCount': pages
+        }).encode('utf-8'))
+        _write(base + '.pagedata', ('Blank\n' * pages).encode('utf-8'))
+        for page in range(pages):
+            _write('%s/%d.rm' % (base, page), _page(rng, page_size))
+            _write('%s/%d-metadata.json' % (base, page),
+                   b'{"layers": [{"name": "Layer 1"}]}')
+            _write('%s.thumbnails/%d.jpg' % (base, page),
+                   os.urandom(page_size // 4))
+    device = root + '/usr/share/remarkable'
+    for name in ('suspended', 'poweroff', 'starting', 'batteryempty'):
+        _write(device + '/' + name + '.png', os.urandom(50000))
+    for number in range(20):
+        _write('%s/templates/P Template %d.png' % (device, number),
+               os.urandom(30000))
+    _write(root + '/home/root/.config/remarkable/xochitl.conf',
+           (CONFIG % 'abcdef').encode('utf-8'))
@@ -0,0 +1,229 @@
+"""Time config fetch, template push and library pull against a fake tablet
+
+    python bench/transfer_bench.py --profile wifi --documents 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+import core  # noqa: E402
+import events  # noqa: E402
+from fake_tablet import FakeTablet  # noqa: E402
+from fake_tablet import seed  # noqa: E402
+import sync  # noqa: E402
+from tablet import COMPRESSION_MODES  # noqa: E402
+from tablet import OFF  # noqa: E402
+from tablet import REMOTE_DOC_DIR  # noqa: E402
+
+# Round trip seconds and bytes per second
+PROFILES = {
+    'local': (0.0, None),
+    'usb': (0.001, 30 * 1024 * 1024),
+    'wifi': (0.02, 2 * 1024 * 1024),
+}
+TEMPLATES = 40
+TEMPLATE_SIZE = 30000
+
+HEADER = '%-18s %9s %8s %7s %11s %11s %7s %9s'
+ROW = '%-18s %9.3f %8d %7d %11d %11d %7d %9.1f'
+
+
+class Workspace(object):
+    """Local directories laid out the way the app keeps them"""
+
+    def __init__(self, root):
+        """Initialize the class"""
+        self.root = root
+        self.backup_dir = os.path.join(root, 'myfiles') + '/'
+        self.template_dir = os.path.join(root, 'additional-templates') + '/'
+        self.splash_dir = os.path.join(root, 'splash') + '/'
+        self.snapshot_dir = os.path.join(root, 'snapshots') + '/'
+        self.manifest_file = os.path.join(root, 'manifest.json')
+        self.hash_file = os.path.join(root, 'hashes.json')
+        self.metrics_file = os.path.join(root, 'metrics.jsonl')
+        os.makedirs(self.backup_dir)
+        os.makedirs(self.template_dir)
+        os.makedirs(self.splash_dir)
+        for number in range(TEMPLATES):
+            path = '%sBench Template %d.png' % (self.template_dir, number)
+            with open(path, 'wb') as template:
+                template.write(os.urandom(TEMPLATE_SIZE))
+
+    def install(self):
+        """Have the core keep its files here rather than in the app's home"""
+        core.BACKUP_DIR = self.backup_dir
+        core.TEMPLATE_DIR = self.template_dir
+        core.SPLASH_DIR = self.splash_dir
+        core.SNAPSHOT_DIR = self.snapshot_dir
+        core.MANIFEST_FILE = self.manifest_file
+        core.HASH_FILE = self.hash_file
+        core.METRICS_FILE = self.metrics_file
+
+    def reset_backup(self, assistant):
+        """Start the next pull from an empty backup"""
+        shutil.rmtree(self.backup_dir)
+        os.makedirs(self.backup_dir)
+        assistant.manifest.entries = {}
+        assistant.manifest.save()
+
+
+def landed(assistant):
+    """Files the assistant reported on disk since the last call"""
+    return sum(
+        1 for event in assistant.events.drain() if event.kind == events.BYTES
+    )
+
+
+def connect(assistant):
+    """Key exchange, password auth and the firmware check"""
+    assistant.connect()
+    return 0
+
+
+def fetch_config(assistant, workspace):
+    """Read the tablet's config the way the settings screen does"""
+    assistant._get_config()
+    return 1
+
+
+def push_templates(assistant, workspace):
+    """Send the templates the way Push Templates does"""
+    sent, _, _ = assistant._push_templates()
+    return sent
+
+
+def pull_library(assistant, workspace):
+    """Pull only what changed, file by file"""
+    landed(assistant)
+    assistant._get_directory(REMOTE_DOC_DIR, workspace.backup_dir)
+    return landed(assistant)
+
+
+def full_backup(assistant, workspace):
+    """Pull everything as one tar stream, or file by file without tar"""
+    workspace.reset_backup(assistant)
+    landed(assistant)
+    assistant._get_archive(REMOTE_DOC_DIR, workspace.backup_dir)
+    return landed(assistant)
+
+
+def measure(tablet, name, func, *args):
+    """Run one scenario and collect the counters"""
+    tablet.stats.reset()
+    start = time.time()
+    files = func(*args)
+    elapsed = time.time() - start
+    counts = tablet.stats.snapshot()
+    return dict(
+        name=name,
+        seconds=elapsed,
+        sftp_requests=counts['sftp_requests'],
+        exec_commands=counts['exec_commands'],
+        bytes_up=counts['bytes_up'],
+        bytes_down=counts['bytes_down'],
+        files=files,
+        files_per_second=files / elapsed if elapsed else 0.0
+    )
+
+
+def run(args):
+    """Seed a fake tablet, run each scenario, return the results"""
+    latency, bandwidth = PROFILES[args.profile]
+    if args.latency_ms is not None:
+        latency = args.latency_ms / 1000.0
+    if args.bandwidth is not None:
+        bandwidth = args.bandwidth * 1024 * 1024 or None
+    scratch = tempfile.mkdtemp(prefix='remark-bench-')
+    results = []
+    try:
+        device_root = os.path.join(scratch, 'tablet')
+        seed(device_root, args.documents, args.pages, args.page_size)
+        workspace = Workspace(os.path.join(scratch, 'local'))
+        workspace.install()
+        with FakeTablet(device_root, latency, bandwidth) as tablet:
+            assistant = core.Assistant(remember=False)
+            assistant.configure(
+                tablet.host, tablet.port, 'root', tablet.password,
+                workers=args.channels, compression=args.compression
+            )
+            try:
+                results.append(measure(
+                    tablet, 'connect', connect, assistant
+                ))
+                results.append(measure(
+                    tablet, 'config fetch', fetch_config, assistant,
+                    workspace
+                ))
+                results.append(measure(
+                    tablet, 'template push', push_templates, assistant,
+                    workspace
+                ))
+                results.append(measure(
+                    tablet, 'template re-push', push_templates, assistant,
+                    workspace
+                ))
+                results.append(measure(
+                    tablet, 'library pull', pull_library, assistant,
+                    workspace
+                ))
+                results.append(measure(
+                    tablet, 'library re-pull', pull_library, assistant,
+                    workspace
+                ))
+                results.append(measure(
+                    tablet, 'full backup', full_backup, assistant, workspace
+                ))
+            finally:
+                assistant.close()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def report(results):
+    """Print one line per scenario"""
+    print(HEADER % ('scenario', 'seconds', 'sftp', 'exec', 'bytes up',
+                    'bytes down', 'files', 'files/s'))
+    for result in results:
+        print(ROW % (
+            result['name'], result['seconds'], result['sftp_requests'],
+            result['exec_commands'], result['bytes_up'],
+            result['bytes_down'], result['files'],
+            result['files_per_second']
+        ))
+
+
+def main():
+    """Parse the arguments and run the benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        default='usb')
+    parser.add_argument('--latency-ms', type=float,
+                        help='round trip time, overrides the profile')
+    parser.add_argument('--bandwidth', type=float,
+                        help='MB/s, 0 for unlimited, overrides the profile')
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=20000)
+    parser.add_argument('--channels', type=int, default=sync.WORKERS)
+    parser.add_argument('--compression', choices=COMPRESSION_MODES,
+                        default=OFF)
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as json')
+    args = parser.parse_args()
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
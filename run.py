@@ -1,5 +1,6 @@
 #!python3.6
 
+from multiprocessing import freeze_support
 import os
 import sys
 
@@ -8,5 +9,6 @@ sys.path.insert(0, os.path.join(ROOT, 'pkgs'))
 sys.path.append(ROOT)
 
 if __name__ == '__main__':
-    import main
-    main.MyApp().run()
+    freeze_support()
+    import gui
+    gui.MyApp().run()
@@ -0,0 +1,379 @@
+"""Command line front end to the core, runs without Kivy or a display
+
+    python src/cli.py pull
+    python src/cli.py --host 192.168.1.20 pull --every 600
+    python src/cli.py verify
+    python src/cli.py push-settings --idle 30 --suspend 120
+    python src/cli.py push-templates
+    python src/cli.py upload paper.pdf book.epub
+    python src/cli.py fleet tablets.ini --concurrency 8
+    python src/cli.py snapshots
+    python src/cli.py restore 20180301T090000Z ~/restored
+"""
+import argparse
+import re
+import sys
+from threading import Thread
+import time
+
+import core
+import events
+import fleet
+import sync
+import tablet
+
+POLL_INTERVAL = .25
+SUMMARY = '%-12s %6d done %9.1f MB %9.1f MB/s %3d retries %3d errors'
+MARKUP = re.compile(r'\[/?(b|i|u|color)(=[^\]]*)?\]')
+TABLE_ROW = '%-16s %-16s %-10s %7s  %s'
+FLEET_SUMMARY = '%d tablets in %.1f s: %s'
+SNAPSHOT_ROW = '%-20s %s %7d files %9.1f MB'
+DIFF_ROW = '%s %s'
+RESTORED = 'Restored %d files to %s'
+# Move the cursor up over the last table and clear each line as it goes
+UP = '\x1b[%dA'
+CLEAR = '\x1b[2K'
+
+
+def plain(text):
+    """Status text without the Kivy markup"""
+    return MARKUP.sub('', text).strip()
+
+
+def report(assistant):
+    """Print the status events so far, only the latest of the progress ones"""
+    statuses = [
+        event.value for event in assistant.events.drain()
+        if event.kind == events.STATUS
+    ]
+    for position, status in enumerate(statuses):
+        # Progress lines name the file on a second line, skip all but one
+        if '\n' in status and position < len(statuses) - 1 and \
+                '\n' in statuses[position + 1]:
+            continue
+        print(plain(status))
+    sys.stdout.flush()
+
+
+def summarize(assistant):
+    """One line per kind of transfer the command made"""
+    for operation, totals in sorted(assistant.metrics.summary().items()):
+        print(SUMMARY % (
+            operation,
+            totals['count'],
+            totals['bytes'] / 1000000.0,
+            totals['rate'] / 1000000.0,
+            totals['retries'],
+            totals['errors']
+        ))
+
+
+def run(assistant, func, *args):
+    """Run func on a worker, printing its progress, return its result"""
+    result = []
+    worker = Thread(target=lambda: result.append(func(*args)))
+    worker.daemon = True
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(POLL_INTERVAL)
+            report(assistant)
+    except KeyboardInterrupt:
+        assistant.status = assistant.STOPPING
+        worker.join()
+    report(assistant)
+    return result[0] if result else None
+
+
+def pull(assistant, args):
+    """Back up the library, over and over with --every"""
+    while True:
+        if not run(assistant, assistant.pull, args.full):
+            if not args.every:
+                return 1
+        if not args.every or assistant.stopping():
+            return 0
+        time.sleep(args.every)
+
+
+def verify(assistant, args):
+    """Check the backup against the tablet's md5s, list what differs"""
+    checked = run(assistant, assistant.verify)
+    if checked is None:
+        return 1
+    for path in checked[1]:
+        print(path)
+    return 1 if checked[1] else 0
+
+
+def push_settings(assistant, args):
+    """Change the times and password, unset ones keep the tablet's value"""
+    settings = run(assistant, assistant.get_config)
+    if settings is None:
+        return 1
+    idle = str(args.idle) if args.idle is not None else settings['idle']
+    suspend = str(args.suspend) if args.suspend is not None else \
+        settings['suspend']
+    password = args.new_password or settings['password']
+    if not run(assistant, assistant.push_settings, idle, suspend, password):
+        return 1
+    print(plain(core.SETTINGS_SAVED))
+    return 0
+
+
+def push_templates(assistant, args):
+    """Send new and changed templates and splash screens"""
+    pushed = run(assistant, assistant.push_templates)
+    if pushed is None:
+        return 1
+    sent, skipped, skipped_bytes = pushed
+    print(plain(core.REMOTE_FILE_SAVED % (
+        sent, skipped, skipped_bytes / 1000000.0
+    )))
+    return 0
+
+
+def upload(assistant, args):
+    """Upload documents and pull them back into the backup"""
+    for path in args.files:
+        assistant.upload(path)
+    run(assistant, wait_for_uploads, assistant)
+    return 1 if assistant.upload_errors else 0
+
+
+def wait_for_uploads(assistant):
+    """Block until the upload workers are done"""
+    while not assistant.uploads().idle():
+        time.sleep(POLL_INTERVAL)
+    return True
+
+
+def table_row(device):
+    """One device's line of the fleet table"""
+    detail = ' '.join(plain(device.detail).split())
+    return TABLE_ROW % (
+        device.name[:16], device.host[:16], device.state,
+        '%.1fs' % device.elapsed(), detail[:60]
+    )
+
+
+class FleetTable(object):
+    """Redraws the fleet table in place on a terminal, else prints changes"""
+
+    def __init__(self, stream=sys.stdout):
+        """Initialize the class"""
+        self.stream = stream
+        self.live = stream.isatty()
+        self.drawn = 0
+        self.states = {}
+
+    def __call__(self, devices):
+        """Show the devices' current states"""
+        if self.live:
+            if self.drawn:
+                self.stream.write(UP % self.drawn)
+            rows = [TABLE_ROW % ('tablet', 'host', 'state', 'time', '')]
+            rows += [table_row(device) for device in devices]
+            for row in rows:
+                self.stream.write(CLEAR + row + '\n')
+            self.drawn = len(rows)
+        else:
+            for device in devices:
+                if self.states.get(device.name) != device.state:
+                    self.states[device.name] = device.state
+                    self.stream.write(table_row(device) + '\n')
+        self.stream.flush()
+
+
+def fleet_push(assistant, args):
+    """Push settings, templates and splash screens to every tablet listed"""
+    started = time.time()
+    devices = fleet.read_inventory(args.inventory)
+    show = FleetTable()
+    tablets = fleet.Fleet(
+        devices,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        settings=not args.skip_settings,
+        templates=not args.skip_templates,
+        compression=args.compression
+    )
+    tablets.run(update=lambda running: show(running.devices))
+    show(devices)
+    counts = tablets.summary()
+    print(FLEET_SUMMARY % (
+        len(devices),
+        time.time() - started,
+        ', '.join(
+            '%d %s' % (counts[state], state) for state in sorted(counts)
+        )
+    ))
+    return 0 if counts.get(fleet.DONE, 0) == len(devices) else 1
+
+
+def list_snapshots(assistant, args):
+    """List the dated snapshots of My Files, oldest first"""
+    store = assistant.snapshots()
+    for name in store.names():
+        entry = store.index[name]
+        print(SNAPSHOT_ROW % (
+            name,
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['time'])),
+            entry['files'],
+            entry['bytes'] / 1000000.0
+        ))
+    return 0
+
+
+def diff(assistant, args):
+    """Show what changed between two snapshots, or one and the latest"""
+    store = assistant.snapshots()
+    try:
+        added, removed, changed = store.diff(
+            args.old, args.new or store.latest()
+        )
+    except KeyError as error:
+        print('No snapshot %s' % error.args[0])
+        return 1
+    for mark, paths in (('+', added), ('-', removed), ('*', changed)):
+        for path in paths:
+            print(DIFF_ROW % (mark, path))
+    return 0
+
+
+def restore(assistant, args):
+    """Rebuild a snapshot in a directory of its own"""
+    try:
+        count = assistant.snapshots().restore(
+            args.name, args.target, link=args.link
+        )
+    except KeyError as error:
+        print('No snapshot %s' % error.args[0])
+        return 1
+    print(RESTORED % (count, args.target))
+    return 0
+
+
+def parser():
+    """The command line"""
+    preferences = core.load_preferences()
+    main_parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0]
+    )
+    main_parser.add_argument('--host', default=core.DEFAULT_HOST)
+    main_parser.add_argument('--port', type=int, default=22)
+    main_parser.add_argument('--username', default='root')
+    main_parser.add_argument(
+        '--password', default=preferences['password'],
+        help='tablet ssh password, defaults to the one the GUI saved'
+    )
+    main_parser.add_argument(
+        '--channels', type=int, default=preferences['channels'],
+        help='sftp channels to download over at once'
+    )
+    main_parser.add_argument(
+        '--compression', choices=tablet.COMPRESSION_MODES,
+        default=preferences['compression'],
+        help='auto compresses only when the link measures slow'
+    )
+    main_parser.add_argument(
+        '--bandwidth', type=float, default=preferences['bandwidth'],
+        help='cap pulls at so many MB/s, 0 for no cap'
+    )
+    main_parser.add_argument(
+        '--window', type=int, default=sync.WINDOW // 1024,
+        help='KB of each file asked for at once, more suits slow links'
+    )
+    main_parser.add_argument(
+        '--verbose', action='store_true',
+        help='print transfer totals and rates at the end'
+    )
+    commands = main_parser.add_subparsers(dest='command')
+    commands.required = True
+
+    pull_parser = commands.add_parser('pull', help=pull.__doc__)
+    pull_parser.add_argument('--full', action='store_true',
+                             help='stream everything as one tar archive')
+    pull_parser.add_argument('--every', type=float, default=0,
+                             help='keep running, pull every so many seconds')
+    pull_parser.set_defaults(func=pull)
+
+    verify_parser = commands.add_parser('verify', help=verify.__doc__)
+    verify_parser.set_defaults(func=verify)
+
+    settings_parser = commands.add_parser(
+        'push-settings', help=push_settings.__doc__
+    )
+    settings_parser.add_argument('--idle', type=int,
+                                 help='minutes before suspend')
+    settings_parser.add_argument('--suspend', type=int,
+                                 help='minutes of suspend before power off')
+    settings_parser.add_argument('--new-password',
+                                 help='new tablet ssh password')
+    settings_parser.set_defaults(func=push_settings)
+
+    templates_parser = commands.add_parser(
+        'push-templates', help=push_templates.__doc__
+    )
+    templates_parser.set_defaults(func=push_templates)
+
+    upload_parser = commands.add_parser('upload', help=upload.__doc__)
+    upload_parser.add_argument('files', nargs='+')
+    upload_parser.set_defaults(func=upload)
+
+    fleet_parser = commands.add_parser('fleet', help=fleet_push.__doc__)
+    fleet_parser.add_argument(
+        'inventory', help='ini file, a section with host, password, idle, '
+        'suspend and new_password per tablet'
+    )
+    fleet_parser.add_argument('--concurrency', type=int,
+                              default=fleet.CONCURRENCY,
+                              help='tablets to push to at once')
+    fleet_parser.add_argument('--timeout', type=float,
+                              default=fleet.HOST_TIMEOUT,
+                              help='seconds before giving up on a tablet')
+    fleet_parser.add_argument('--skip-settings', action='store_true')
+    fleet_parser.add_argument('--skip-templates', action='store_true')
+    fleet_parser.set_defaults(func=fleet_push)
+
+    snapshots_parser = commands.add_parser(
+        'snapshots', help=list_snapshots.__doc__
+    )
+    snapshots_parser.set_defaults(func=list_snapshots)
+
+    diff_parser = commands.add_parser('diff', help=diff.__doc__)
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new', nargs='?',
+                             help='defaults to the latest snapshot')
+    diff_parser.set_defaults(func=diff)
+
+    restore_parser = commands.add_parser('restore', help=restore.__doc__)
+    restore_parser.add_argument('name')
+    restore_parser.add_argument('target')
+    restore_parser.add_argument(
+        '--link', action='store_true',
+        help='hard link instead of copying, the files must not be edited'
+    )
+    restore_parser.set_defaults(func=restore)
+    return main_parser
+
+
+def main(argv=None):
+    """Parse the arguments and run one command"""
+    args = parser().parse_args(argv)
+    assistant = core.Assistant()
+    assistant.configure(
+        args.host, args.port, args.username, args.password,
+        workers=args.channels, compression=args.compression,
+        bandwidth=args.bandwidth, window=args.window * 1024
+    )
+    try:
+        return args.func(assistant, args)
+    finally:
+        if args.verbose:
+            summarize(assistant)
+        assistant.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,552 @@
+"""Connection, settings and sync engine, shared by the GUI and the CLI"""
+import os
+import pickle
+import sys
+from threading import Lock
+
+import paramiko
+
+import events
+from metrics import CONFIG_READ
+from metrics import CONFIG_WRITE
+from metrics import Metrics
+from metrics import RateMeter
+from metrics import rate_text
+import settings
+from settings import DEVPASS_KEY
+from settings import IDLE_KEY
+from settings import SUSPEND_KEY
+from snapshots import SnapshotStore
+import sync
+import tablet
+from tablet import REMOTE_CONFIG_FILE
+from tablet import REMOTE_DOC_DIR
+from tablet import REMOTE_SPLASH_DIR
+from tablet import REMOTE_TEMPLATE_DIR
+from tablet import TabletConnection
+from uploads import UploadQueue
+
+LIMIT = 5
+DEFAULT_HOST = '10.11.99.1'
+
+REMIND = '[b][color=ff0000] Restart tablet to see changes.[/color][/b]'
+WARN = '[b][color=ff0000]NOT SAVED.[/color][/b] '
+
+INITIALIZE = 'Attempting to connect to remarkable tablet'
+TIMES_NOT_SET = '[color=ff0000]On tablet select power settings and ' + \
+    'toggle both settings off and on[/color]\nThen restart tablet.'
+NOT_CONNECTED = 'Failed to connect to remarkable tablet'
+STOPPED = 'Stopped, not connecting again'
+CONNECTED = 'Successfully connected to remarkable tablet'
+LOCAL_FILE_SAVED = 'Settings saved locally'
+UNCHANGED = 'Settings already on the tablet, nothing written'
+CHANGED_ON_TABLET = WARN + '\nThe tablet changed its settings since they ' + \
+    'were read, reconnect and try again'
+SETTINGS_SAVED = 'Settings saved to tablet\n' + REMIND
+REMOTE_FILE_SAVED = 'Settings saved to tablet, sent %d files, ' + \
+    'skipped %d unchanged (%.1f MB)\n' + REMIND
+BE_SAFE = WARN + '\nTimes and password length must be greater than %d' % LIMIT
+NO_LOCAL = WARN + '\nUnable to find local settings'
+UPLOADING = 'Uploading'
+SENDING = 'Uploading %s, %d%%, %s'
+QUEUED = 'Queued %s for upload'
+ADDED = 'Uploaded %s and added it to My Files'
+UPLOAD_FAILED = WARN + '\nUpload of %s failed: %s'
+LISTED = 'Tablet has %d documents, %.1f MB'
+PULLED = 'Pulled %d changed files, %d unchanged, %d removed'
+UNPACKING = 'Full backup: %d entries, %.1f MB'
+BACKED_UP = 'Full backup done: %d entries, %.1f MB'
+SNAPSHOTTING = 'Keeping a snapshot of %d files'
+SNAPSHOT = 'Snapshot %s kept, %d new files stored (%.1f MB)'
+SNAPSHOT_FAILED = WARN + '\nSnapshot not kept: %s'
+VERIFYING = 'Checking %d of %d against the tablet'
+VERIFIED = 'Checked %d files, %d differ from the tablet and will be ' + \
+    'pulled again'
+BUSY = 'Already pulling from the tablet, wait for it to finish'
+
+# Authentication and bad host key errors are both SSHExceptions
+CONNECTION_ERRORS = (paramiko.ssh_exception.SSHException, IOError)
+
+home = os.path.dirname(os.path.abspath(__file__))
+if getattr(sys, 'frozen', False):
+    home = sys._MEIPASS
+APP_HOME = home + '/remark-assist/'
+if not os.path.exists(APP_HOME):
+    os.makedirs(APP_HOME)
+TEMPLATE_DIR = APP_HOME + 'additional-templates/'
+SPLASH_DIR = APP_HOME + 'splash/'
+BACKUP_DIR = APP_HOME + 'myfiles/'
+
+PICKLE_FILE = APP_HOME + 'config.pickle'
+MANIFEST_FILE = APP_HOME + 'manifest.json'
+HASH_FILE = APP_HOME + 'hashes.json'
+INDEX_FILE = APP_HOME + 'library.sqlite'
+THUMB_DIR = APP_HOME + 'thumbnails/'
+PREVIEW_DIR = APP_HOME + 'previews/'
+METRICS_FILE = APP_HOME + 'metrics.jsonl'
+SNAPSHOT_DIR = APP_HOME + 'snapshots/'
+
+FIRMWARE = 'cat /etc/version'
+
+
+def make_directories():
+    """Create the local directories the app works out of"""
+    for directory in (BACKUP_DIR, TEMPLATE_DIR, SPLASH_DIR):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+def load_preferences():
+    """The saved tablet password, channels, compression and bandwidth cap"""
+    preferences = {
+        'password': '',
+        'channels': sync.WORKERS,
+        'compression': tablet.AUTO,
+        'bandwidth': 0
+    }
+    if os.path.exists(PICKLE_FILE):
+        pickle_in = open(PICKLE_FILE, "rb")
+        preferences.update(pickle.load(pickle_in))
+        pickle_in.close()
+    return preferences
+
+
+def save_preferences(password, channels, compression=tablet.AUTO,
+                     bandwidth=0):
+    """Remember the tablet password, channels, compression and bandwidth cap"""
+    save_pw = {
+        'password': password,
+        'channels': channels,
+        'compression': compression,
+        'bandwidth': bandwidth
+    }
+    pickle_out = open(PICKLE_FILE, "wb")
+    pickle.dump(save_pw, pickle_out)
+    pickle_out.close()
+
+
+def read_settings(config):
+    """idle and suspend minutes and the password out of a xochitl.conf"""
+    settings = {'idle': '', 'suspend': '', 'password': ''}
+    for name, key in (('idle', IDLE_KEY), ('suspend', SUSPEND_KEY)):
+        milliseconds = config.get(key, default='')
+        if milliseconds.isdigit():
+            settings[name] = str(int(int(milliseconds)/1000/60))
+    settings['password'] = config.get(DEVPASS_KEY, default='')
+    return settings
+
+
+def valid_settings(idle, suspend, password):
+    """Times are whole minutes and nothing is too short"""
+    return bool(
+        idle and suspend and idle.isdigit() and suspend.isdigit() and
+        len(password) > LIMIT and
+        int(idle) > LIMIT and int(suspend) > LIMIT
+    )
+
+
+def apply_settings(config, idle, suspend, password):
+    """Put the new times and password in the config, True if any changed"""
+    changed = config.set(IDLE_KEY, int(int(idle)*1000*60))
+    changed = config.set(SUSPEND_KEY, int(int(suspend)*1000*60)) or changed
+    return config.set(DEVPASS_KEY, password) or changed
+
+
+def template_pairs():
+    """(local, remote) of every template and splash screen to push"""
+    return local_pairs(TEMPLATE_DIR, REMOTE_TEMPLATE_DIR) + \
+        local_pairs(SPLASH_DIR, REMOTE_SPLASH_DIR)
+
+
+def local_pairs(local_directory, remote_directory):
+    """(local, remote) for every file in local_directory"""
+    pairs = []
+    for item in sorted(os.listdir(local_directory)):
+        if os.path.isfile(local_directory + item):
+            pairs.append((local_directory + item, remote_directory + item))
+    return pairs
+
+
+class Assistant(object):
+    """Does the actual work of saving and fetching, reports through events"""
+    RUNNING = 0
+    UPDATING = 1
+    STOPPING = 2
+
+    def __init__(self, event_queue=None, metrics=None, hashes=None,
+                 remember=True):
+        """Initialize the class, remember saves the password as the GUI's"""
+        make_directories()
+        self.status = self.RUNNING
+        self.remember = remember
+        self.config = None
+        self.config_md5 = None
+        self._own_metrics = metrics is None
+        self.metrics = metrics or Metrics(METRICS_FILE)
+        self.connection = TabletConnection(metrics=self.metrics)
+        self._described = None
+        self.workers = sync.WORKERS
+        self.bandwidth = 0
+        self.throttle = None
+        self.window = sync.WINDOW
+        self.manifest = sync.SyncManifest(MANIFEST_FILE)
+        self.remote_tree = tablet.RemoteTree()
+        self.hashes = hashes or sync.HashCache(HASH_FILE)
+        self.events = event_queue or events.EventQueue()
+        self.upload_percent = {}
+        self.upload_meters = {}
+        self.upload_errors = []
+        self._uploads = None
+        self._snapshots = None
+        self._snapshots_lock = Lock()
+
+    def configure(self, host, port=22, username='root', password='',
+                  workers=None, compression=None, timeout=None,
+                  bandwidth=None, window=None):
+        """Point the connection at a tablet, bandwidth caps pulls in MB/s,
+        window is how many bytes of each file are asked for at once"""
+        self.connection.configure(
+            host, port, username, password, compression=compression,
+            timeout=timeout
+        )
+        if workers is not None:
+            self.workers = max(1, min(int(workers), sync.MAX_WORKERS))
+        if bandwidth is not None and bandwidth != self.bandwidth:
+            self.bandwidth = bandwidth
+            self.throttle = None
+            if bandwidth > 0:
+                self.throttle = sync.Throttle(bandwidth * 1000000)
+        if window is not None:
+            self.window = max(sync.REQUEST, int(window))
+
+    def connect(self):
+        """Open the transport now, refuse once the assistant is stopping"""
+        if self.stopping():
+            raise IOError(STOPPED)
+        self.connection.transport()
+        if self._described != self.connection.host:
+            self._described = self.connection.host
+            self._describe()
+        return self.connection
+
+    def _describe(self):
+        """Tag the metrics with the tablet and its firmware build"""
+        exit_status, output, _ = self.connection.run(FIRMWARE)
+        firmware = None
+        if exit_status == 0:
+            firmware = output.decode('utf-8', 'replace').strip()
+        self.metrics.describe(
+            host=self.connection.host,
+            firmware=firmware,
+            link_rate=self.connection.link_rate,
+            compression=self.connection.compression,
+            compressed=self.connection.compressed()
+        )
+
+    def _set_status(self, text):
+        """Everything the user sees goes through the event queue"""
+        self.events.publish(events.STATUS, text)
+
+    def _safely(self, func, *args):
+        """Run func, report a dropped or refused connection, None if so"""
+        try:
+            return func(*args)
+        except CONNECTION_ERRORS as conn_e:
+            self._set_status(NOT_CONNECTED + '\n' + str(conn_e))
+            return None
+
+    def get_config(self):
+        """Settings dict from the tablet's config, None if unreachable"""
+        return self._safely(self._get_config)
+
+    def _get_config(self):
+        """Read the tablet config into memory"""
+        connection = self.connect()
+        self._set_status(CONNECTED)
+        with self.metrics.timer(CONFIG_READ, path=REMOTE_CONFIG_FILE):
+            self.config, self.config_md5 = settings.read_config(
+                connection, REMOTE_CONFIG_FILE
+            )
+        current = read_settings(self.config)
+        if not current['idle'] or not current['suspend']:
+            self._set_status(TIMES_NOT_SET)
+        return current
+
+    def save_locally(self, idle, suspend, password):
+        """Put the new vars in the config held in memory"""
+        if not valid_settings(idle, suspend, password):
+            self._set_status(BE_SAFE)
+            return False
+        if self.config is None:
+            self._set_status(NOT_CONNECTED)
+            return False
+        apply_settings(self.config, idle, suspend, password)
+        self._remember(password)
+        self._set_status(LOCAL_FILE_SAVED)
+        return True
+
+    def push_settings(self, idle, suspend, password):
+        """Save locally then swap the config in on the tablet if it changed"""
+        if not self.save_locally(idle, suspend, password):
+            return None
+        if not self.config.dirty:
+            self._set_status(UNCHANGED)
+            return True
+        try:
+            return self._safely(self._push_settings, password)
+        except settings.ConfigChanged:
+            self.config = None
+            self._set_status(CHANGED_ON_TABLET)
+            return None
+
+    def _push_settings(self, password):
+        """Write the new config and remember the new password"""
+        self.connect()
+        self._set_status(CONNECTED)
+        metrics = self.metrics
+        with metrics.timer(CONFIG_WRITE, path=REMOTE_CONFIG_FILE) as timer:
+            timer.bytes = len(self.config.text())
+            self.config_md5 = settings.write_config(
+                self.connection, self.config, self.config_md5,
+                REMOTE_CONFIG_FILE
+            )
+        self.connection.password = password
+        self._remember(password)
+        return True
+
+    def _remember(self, password):
+        """Save the password for next time, fleet runs don't"""
+        if self.remember:
+            save_preferences(
+                password, self.workers, self.connection.compression,
+                self.bandwidth
+            )
+
+    def push_templates(self):
+        """Send the templates and splash screens the tablet doesn't have"""
+        return self._safely(self._push_templates)
+
+    def _push_templates(self):
+        """(sent, skipped, skipped bytes)"""
+        self.connect()
+        return sync.push(
+            self.connection, template_pairs(), self.hashes,
+            status=self._uploading
+        )
+
+    def _uploading(self, filename):
+        """Show which file is going up"""
+        self._set_status(UPLOADING + "\n" + filename)
+
+    def pull(self, full=False):
+        """Pull down the files from the remarkable tablet"""
+        self.status = self.UPDATING
+        try:
+            return self._safely(self._pull, full)
+        finally:
+            if self.status == self.UPDATING:
+                self.status = self.RUNNING
+            self.events.publish(events.FINISHED)
+
+    def _pull(self, full):
+        """Tar for a first or full backup, changed files otherwise"""
+        self.connect()
+        if full or not self.manifest.entries:
+            self._get_archive(REMOTE_DOC_DIR, BACKUP_DIR)
+        else:
+            self._get_directory(REMOTE_DOC_DIR, BACKUP_DIR)
+        self._snapshot()
+        return True
+
+    def verify(self):
+        """Check the backup against the tablet, None if it couldn't"""
+        self.status = self.UPDATING
+        try:
+            return self._safely(self._verify)
+        finally:
+            if self.status == self.UPDATING:
+                self.status = self.RUNNING
+            self.events.publish(events.FINISHED)
+
+    def _verify(self):
+        """(checked, paths that differ), those go on the next pull"""
+        self.connect()
+        checked, differ = sync.verify(
+            self.connection,
+            REMOTE_DOC_DIR,
+            BACKUP_DIR,
+            self.manifest,
+            status=self._verifying,
+            stopped=self.stopping
+        )
+        self._set_status(VERIFIED % (checked, len(differ)))
+        return checked, differ
+
+    def _verifying(self, filename, checked, total):
+        """Show how far the check has got"""
+        self._set_status(VERIFYING % (checked, total) + "\n" + filename)
+
+    def snapshots(self):
+        """The snapshot store, opened on first use"""
+        # Pulls and upload fetches both record md5s in its hash cache
+        with self._snapshots_lock:
+            if self._snapshots is None:
+                self._snapshots = SnapshotStore(SNAPSHOT_DIR)
+            return self._snapshots
+
+    def _snapshot(self):
+        """Keep what was just pulled as a dated snapshot"""
+        if self.stopping():
+            return
+        # An upload can be adding to the manifest while this runs
+        paths = self.manifest.paths()
+        self._set_status(SNAPSHOTTING % len(paths))
+        try:
+            name, objects, size = self.snapshots().take(
+                BACKUP_DIR, paths, stopped=self.stopping
+            )
+        except (IOError, OSError) as error:
+            self._set_status(SNAPSHOT_FAILED % error)
+            return
+        if name:
+            self._set_status(SNAPSHOT % (name, objects, size / 1000000.0))
+
+    def _get_directory(self, remote_directory, local_directory):
+        """Pull only the files that changed since the last pull"""
+        self.remote_tree = tablet.list_tree(self.connection, remote_directory)
+        self._set_status(LISTED % (
+            len(self.remote_tree.documents()),
+            self.remote_tree.total_size() / 1000000.0
+        ))
+        fetched, unchanged, removed = sync.pull(
+            self.connection,
+            remote_directory,
+            local_directory,
+            self.manifest,
+            workers=self.workers,
+            stopped=self.stopping,
+            tree=self.remote_tree,
+            landed=self._landed,
+            planned=self._planned,
+            throttle=self.throttle,
+            window=self.window,
+            hashes=self.snapshots().hashes
+        )
+        self._set_status(PULLED % (fetched, unchanged, removed))
+
+    def _planned(self, files, size):
+        """Tell whoever shows progress how much is coming"""
+        self.events.publish(events.EXPECTED, size)
+
+    def _get_archive(self, remote_directory, local_directory):
+        """Pull everything as one tar stream, or file by file without tar"""
+        # The last backup's size is the best guess there is before the stream
+        self.events.publish(events.EXPECTED, sum(
+            entry[0] for entry in self.manifest.entries.values()
+        ))
+        result = sync.tar_pull(
+            self.connection,
+            remote_directory,
+            local_directory,
+            self.manifest,
+            status=self._unpacking,
+            stopped=self.stopping,
+            landed=self._landed,
+            compress=(self.connection.wants_compression() and
+                      not self.connection.compressed()),
+            throttle=self.throttle,
+            hashes=self.snapshots().hashes
+        )
+        if result is None:
+            self._get_directory(remote_directory, local_directory)
+        else:
+            entries, size = result
+            self._set_status(BACKED_UP % (entries, size / 1000000.0))
+
+    def _unpacking(self, filename, entries, size):
+        """Show how much of the tar stream has arrived"""
+        self._set_status(
+            UNPACKING % (entries, size / 1000000.0) + "\n" + filename
+        )
+
+    def _landed(self, remote_file):
+        """A pulled file is on disk"""
+        self.events.publish(events.BYTES, (remote_file.path, remote_file.size))
+        key = events.document_uuid(remote_file.path)
+        if key:
+            self.events.publish(events.DOCUMENT_ADDED, key)
+
+    def stopping(self):
+        """Background work checks this to bail out early"""
+        return self.status == self.STOPPING
+
+    def uploads(self):
+        """The upload workers, started on first use"""
+        if self._uploads is None:
+            self._uploads = UploadQueue(
+                progress=self._upload_progress,
+                finished=self._uploaded,
+                metrics=self.metrics
+            )
+        return self._uploads
+
+    def upload(self, file_name):
+        """Queue a document for the tablet, returns straight away"""
+        self._set_status(QUEUED % os.path.basename(file_name))
+        self.uploads().add(file_name, self.connection.host)
+
+    def _upload_progress(self, file_name, sent, total):
+        """Called from the upload workers, once per percent"""
+        meter = self.upload_meters.setdefault(file_name, RateMeter())
+        meter.add(sent - meter.total)
+        percent = 100 * sent // total
+        if self.upload_percent.get(file_name) != percent:
+            self.upload_percent[file_name] = percent
+            self._set_status(SENDING % (
+                os.path.basename(file_name),
+                percent,
+                rate_text(meter.rate(), meter.eta(total - sent))
+            ))
+
+    def _uploaded(self, file_name, doc_id, error):
+        """Called from the upload workers, pull just the new documents"""
+        self.upload_percent.pop(file_name, None)
+        self.upload_meters.pop(file_name, None)
+        if error is not None:
+            self.upload_errors.append((file_name, error))
+            self._set_status(
+                UPLOAD_FAILED % (os.path.basename(file_name), error)
+            )
+            return
+        if self._safely(self._fetch_uploaded, doc_id):
+            self._set_status(ADDED % os.path.basename(file_name))
+
+    def _fetch_uploaded(self, doc_id):
+        """Pull what the upload added to the tablet"""
+        if not self.manifest.entries:
+            # Nothing pulled yet, the first pull brings it with the rest
+            return True
+        self.connect()
+        if doc_id:
+            doc_uuids = {doc_id}
+        else:
+            doc_uuids = sync.new_documents(
+                self.connection, REMOTE_DOC_DIR, self.manifest
+            )
+        sync.fetch_documents(
+            self.connection,
+            REMOTE_DOC_DIR,
+            BACKUP_DIR,
+            self.manifest,
+            doc_uuids,
+            landed=self._landed,
+            hashes=self.snapshots().hashes
+        )
+        return True
+
+    def close(self):
+        """Stop background work and drop the connection"""
+        self.status = self.STOPPING
+        self.connection.close()
+        if self._own_metrics:
+            self.metrics.close()
@@ -0,0 +1,44 @@
+"""Progress events from background work, drained by whoever shows them"""
+from collections import namedtuple
+from queue import Empty
+from queue import Queue
+
+STATUS = 'status'
+BYTES = 'bytes transferred'
+EXPECTED = 'bytes expected'
+DOCUMENT_ADDED = 'document added'
+SETTINGS = 'settings read'
+PASSWORD = 'password changed'
+FINISHED = 'finished'
+
+Event = namedtuple('Event', 'kind value')
+
+
+class EventQueue(object):
+    """Thread safe queue of typed progress events"""
+
+    def __init__(self):
+        """Initialize the class"""
+        self._queue = Queue()
+
+    def publish(self, kind, value=None):
+        """Called from any thread"""
+        self._queue.put(Event(kind, value))
+
+    def drain(self):
+        """Every event published so far, never blocks"""
+        drained = []
+        while True:
+            try:
+                drained.append(self._queue.get_nowait())
+            except Empty:
+                return drained
+
+
+def document_uuid(path):
+    """uuid of the document a backed up path belongs to, or None"""
+    name = path.split('/', 1)[0]
+    key, _, extension = name.partition('.')
+    if extension in ('metadata', 'content', 'thumbnails'):
+        return key
+    return None
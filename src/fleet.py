@@ -0,0 +1,233 @@
+"""Push settings, templates and splash screens to a rack of tablets at once
+
+The inventory is an ini file, one section per tablet, DEFAULT for shared
+values:
+
+    [DEFAULT]
+    password = abcdef
+    idle = 30
+    suspend = 120
+
+    [shelf-1]
+    host = 10.0.0.21
+
+    [shelf-2]
+    host = 10.0.0.22
+    new_password = ghijkl
+"""
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import configparser
+from threading import Lock
+from threading import Thread
+import time
+
+import core
+import events
+from metrics import Metrics
+import sync
+import tablet
+
+CONCURRENCY = 4
+HOST_TIMEOUT = 120
+POLL_INTERVAL = .25
+
+WAITING = 'waiting'
+CONNECTING = 'connecting'
+SETTINGS = 'settings'
+TEMPLATES = 'templates'
+DONE = 'done'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+FINISHED = (DONE, FAILED, TIMED_OUT)
+PUSHED = 'sent %d files, %d unchanged'
+
+# A dropped link can surface as EOFError, which _safely doesn't catch
+DEVICE_ERRORS = core.CONNECTION_ERRORS + tablet.LINK_ERRORS
+
+
+class Device(object):
+    """One tablet from the inventory and how far its push got"""
+
+    def __init__(self, name, host, port=22, username='root', password='',
+                 idle=None, suspend=None, new_password=None):
+        """Initialize the class"""
+        self.name = name
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.idle = idle
+        self.suspend = suspend
+        self.new_password = new_password
+        self.state = WAITING
+        self.detail = ''
+        self.sent = 0
+        self.skipped = 0
+        self.started = None
+        self.finished = None
+        self.assistant = None
+
+    def wants_settings(self):
+        """True if the inventory asks for any setting to change"""
+        return bool(self.idle or self.suspend or self.new_password)
+
+    def elapsed(self):
+        """Seconds spent on this tablet so far"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+def read_inventory(path):
+    """Devices in the order the inventory lists them"""
+    parser = configparser.ConfigParser(interpolation=None)
+    with open(path, 'r') as inventory:
+        parser.read_file(inventory)
+    devices = []
+    for name in parser.sections():
+        section = parser[name]
+        if not section.get('host'):
+            raise ValueError('%s: [%s] has no host' % (path, name))
+        devices.append(Device(
+            name,
+            section['host'],
+            port=section.getint('port', 22),
+            username=section.get('username', 'root'),
+            password=section.get('password', ''),
+            idle=section.get('idle'),
+            suspend=section.get('suspend'),
+            new_password=section.get('new_password')
+        ))
+    return devices
+
+
+class Fleet(object):
+    """Runs every device's push on a bounded pool, one connection each"""
+
+    def __init__(self, devices, concurrency=CONCURRENCY,
+                 timeout=HOST_TIMEOUT, settings=True, templates=True,
+                 compression=tablet.AUTO):
+        """Initialize the class, timeout is per tablet in seconds"""
+        self.devices = devices
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.settings = settings
+        self.templates = templates
+        self.compression = compression
+        self.metrics = Metrics(core.METRICS_FILE)
+        self.hashes = sync.HashCache(core.HASH_FILE)
+        self._lock = Lock()
+
+    def run(self, update=None):
+        """Push to every device, calling update(fleet) as states change"""
+        core.make_directories()
+        if self.templates:
+            # Hash once up front so the workers only ever hit the cache
+            for local_path, _ in core.template_pairs():
+                self.hashes.md5(local_path)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                pending = set(
+                    pool.submit(self._push, device) for device in self.devices
+                )
+                while pending:
+                    _, pending = wait(pending, timeout=POLL_INTERVAL)
+                    self._expire()
+                    if update:
+                        update(self)
+        finally:
+            self.hashes.save()
+            self.metrics.close()
+        return self.devices
+
+    def summary(self):
+        """state -> number of devices in it"""
+        counts = {}
+        for device in self.devices:
+            counts[device.state] = counts.get(device.state, 0) + 1
+        return counts
+
+    def _expire(self):
+        """Give up on devices past their timeout"""
+        for device in self.devices:
+            if device.state in FINISHED or device.started is None or \
+                    device.elapsed() < self.timeout:
+                continue
+            self._set(device, TIMED_OUT, 'no answer in %ds' % self.timeout)
+            device.assistant.status = device.assistant.STOPPING
+            # Closing can wait on a connect in progress, don't hold up the rest
+            closer = Thread(target=device.assistant.connection.close)
+            closer.daemon = True
+            closer.start()
+
+    def _set(self, device, state, detail=None):
+        """Move a device on, a finished one stays finished"""
+        with self._lock:
+            if device.state in FINISHED:
+                return False
+            device.state = state
+            if detail is not None:
+                device.detail = detail
+            if state in FINISHED:
+                device.finished = time.time()
+            return True
+
+    def _push(self, device):
+        """Connect, then push settings and templates to one device"""
+        assistant = core.Assistant(
+            metrics=self.metrics, hashes=self.hashes, remember=False
+        )
+        assistant.configure(
+            device.host, device.port, device.username, device.password,
+            compression=self.compression, timeout=self.timeout
+        )
+        device.assistant = assistant
+        device.started = time.time()
+        try:
+            self._set(device, CONNECTING)
+            assistant.connect()
+            if self.settings and device.wants_settings():
+                self._set(device, SETTINGS)
+                if not self._push_settings(device):
+                    return self._failed(device)
+            # Timed out meanwhile, don't start on the next step
+            if assistant.stopping():
+                return
+            if self.templates:
+                self._set(device, TEMPLATES)
+                pushed = assistant.push_templates()
+                if pushed is None:
+                    return self._failed(device)
+                device.sent, device.skipped, _ = pushed
+                self._set(device, DONE, PUSHED % pushed[:2])
+            else:
+                self._set(device, DONE, self._last_status(device))
+        except DEVICE_ERRORS as error:
+            self._set(device, FAILED, str(error) or type(error).__name__)
+        finally:
+            assistant.connection.close()
+
+    def _push_settings(self, device):
+        """Change what the inventory names, the rest keeps the tablet's"""
+        assistant = device.assistant
+        current = assistant.get_config()
+        if current is None:
+            return False
+        return assistant.push_settings(
+            device.idle or current['idle'],
+            device.suspend or current['suspend'],
+            device.new_password or current['password']
+        )
+
+    def _failed(self, device):
+        """Finish the device with the last thing its assistant reported"""
+        self._set(device, FAILED, self._last_status(device))
+
+    def _last_status(self, device):
+        """The newest status the device's assistant published"""
+        statuses = [
+            event.value for event in device.assistant.events.drain()
+            if event.kind == events.STATUS
+        ]
+        return statuses[-1] if statuses else ''
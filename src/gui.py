@@ -0,0 +1,927 @@
+"""The application is a GUI for changing settings on the remarkable tablet"""
+import os
+from shutil import copy2
+import sys
+from threading import Event
+from threading import Thread
+
+import kivy
+from kivy.app import App
+from kivy import Config
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.graphics import Color
+from kivy.graphics import Rectangle
+from kivy.graphics.texture import Texture
+from kivy.uix.anchorlayout import AnchorLayout
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.filechooser import FileChooserListView
+from kivy.uix.gridlayout import GridLayout
+from kivy.uix.image import Image
+from kivy.uix.label import Label
+from kivy.uix.recyclegridlayout import RecycleGridLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.tabbedpanel import TabbedPanel
+from kivy.uix.tabbedpanel import TabbedPanelHeader
+from kivy.uix.textinput import TextInput
+
+import core
+from core import BACKUP_DIR
+from core import INDEX_FILE
+from core import PREVIEW_DIR
+from core import SPLASH_DIR
+from core import TEMPLATE_DIR
+from core import THUMB_DIR
+import events
+from library import CollectionTree
+from library import MetadataIndex
+from metrics import RateMeter
+from metrics import rate_text
+from previews import PreviewService
+import sync
+import tablet
+from thumbnails import LRUCache
+from thumbnails import ThumbnailService
+
+Config.set('graphics', 'multisamples', '0')
+Config.set('input', 'mouse', 'mouse,disable_multitouch')
+kivy.require('1.10.0')
+EVENT_INTERVAL = .25
+
+EXITING = 'Exiting'
+LOADING = 'Loading My Files'
+DOWNLOADED = 'Downloading, %.1f MB so far, %s'
+SEARCH_HINT = 'Search names, titles and tags, or type:pdf, tag:work, pages:12'
+SEARCH_DELAY = .15
+
+
+LOADING_CELL = {
+    'source': 'static/no_image.png',
+    'metadata': {},
+    'key': '',
+    'text': LOADING,
+    'thumbnail': None
+}
+
+
+class StatusLabel(Label):
+    """Common label for statuses, helps w/ positioning"""
+
+    def on_size(self, *args):
+        """Needed this to get the status to the left"""
+        self.canvas.before.clear()
+        self.text_size = self.size
+        with self.canvas.before:
+            Color(1, 1, 1, 0.25)
+            Rectangle(pos=self.pos, size=self.size)
+
+
+class StatusLayout(AnchorLayout):
+    """The status is going to be at the bottom"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(StatusLayout, self).__init__(**kwargs)
+        self.status = core.INITIALIZE
+        self.anchor_x = 'left'
+        self.status_label = StatusLabel(
+            text=self.status,
+            halign='center',
+            markup=True
+        )
+        self.add_widget(self.status_label)
+
+
+class AppController(object):
+    """Thin client of the core, reads the widgets and shows what it reports"""
+
+    def __init__(
+            self,
+            app_config_lout,
+            tablet_config_layout,
+            status_layout,
+            files_header,
+            **kwargs
+    ):
+        """Initialize the class, nothing touches the disk or network yet"""
+        self.status_layout = status_layout
+        self.app_config_lout = app_config_lout
+        self.tablet_config_layout = tablet_config_layout
+        self.files_header = files_header
+        self.core = core.Assistant()
+        self.index = MetadataIndex(INDEX_FILE)
+        self.library_ready = Event()
+        self.transferred = 0
+        self.expected = 0
+        self.meter = RateMeter()
+
+    def start(self):
+        """After the first frame, scan the library and reach the tablet"""
+        Clock.schedule_interval(self._apply_events, EVENT_INTERVAL)
+        Thread(target=self._scan_library).start()
+        self.get_config()
+
+    def _scan_library(self):
+        """Bring the index up to date before My Files is first opened"""
+        try:
+            self.index.scan(BACKUP_DIR)
+        finally:
+            self.library_ready.set()
+
+    def _configure(self):
+        """Point the core at the tablet in the settings"""
+        self.core.configure(
+            self.app_config_lout.ipaddress.text,
+            self.app_config_lout.port.text,
+            self.app_config_lout.username.text,
+            self.app_config_lout.old_password.text,
+            workers=self.app_config_lout.get_channels(),
+            compression=self.app_config_lout.get_compression(),
+            bandwidth=self.app_config_lout.get_bandwidth()
+        )
+
+    def reconnect(self, *args):
+        """Attempt to get the config and files again"""
+        self.core.connection.close()
+        self.get_config(*args)
+
+    def get_config(self, *args):
+        """Always run this in the background"""
+        self.status_layout.status_label.text = core.INITIALIZE
+        self._configure()
+        Thread(target=self._get_config).start()
+
+    def _get_config(self):
+        """Read the tablet's config, the fields are filled in on the clock"""
+        settings = self.core.get_config()
+        if settings is not None:
+            self.core.events.publish(events.SETTINGS, settings)
+
+    def _show_settings(self, settings):
+        """Fill in the fields from the tablet's config"""
+        if settings['idle']:
+            self.tablet_config_layout.idle.text = settings['idle']
+        if settings['suspend']:
+            self.tablet_config_layout.suspend.text = settings['suspend']
+        if settings['password']:
+            self.app_config_lout.old_password.text = settings['password']
+            self.tablet_config_layout.password.text = settings['password']
+
+    def full_backup(self, *args):
+        """Pull the whole library as one tar stream"""
+        self.get_files(*args, full=True)
+
+    def get_files(self, *args, full=False):
+        """Always run this in the background, one pull at a time"""
+        if self.core.status == self.core.UPDATING:
+            self.status_layout.status_label.text = core.BUSY
+            return
+        self.transferred = 0
+        self.expected = 0
+        self.meter = RateMeter()
+        self.status_layout.status_label.text = core.INITIALIZE
+        self._configure()
+        # Set here as well so a second click before the thread starts sees it
+        self.core.status = self.core.UPDATING
+        Thread(target=self.core.pull, args=(full,)).start()
+
+    def _apply_events(self, *args):
+        """Runs on the Kivy clock, applies what the core reported"""
+        pane = self.files_header.content
+        friendly_my_files = pane.files if pane else None
+        documents = set()
+        for event in self.core.events.drain():
+            if event.kind == events.STATUS:
+                self.status_layout.status_label.text = event.value
+            elif event.kind == events.EXPECTED:
+                self.expected = event.value
+            elif event.kind == events.BYTES:
+                path, size = event.value
+                self.transferred += size
+                self.meter.add(size)
+                self.status_layout.status_label.text = DOWNLOADED % (
+                    self.transferred / 1000000.0, self._rate()
+                ) + "\n" + path
+            elif event.kind == events.DOCUMENT_ADDED:
+                documents.add(event.value)
+            elif event.kind == events.SETTINGS:
+                self._show_settings(event.value)
+            elif event.kind == events.PASSWORD:
+                self.app_config_lout.old_password.text = event.value
+            elif event.kind == events.FINISHED and friendly_my_files:
+                friendly_my_files.update_documents(documents)
+                documents = set()
+                friendly_my_files.refresh_widget(friendly_my_files.parent_dir)
+        # A My Files tab that was never opened reads the index when it is
+        if documents and friendly_my_files:
+            friendly_my_files.update_documents(documents)
+
+    def _rate(self):
+        """Recent rate, and the time left when the size is known"""
+        eta = None
+        if self.expected:
+            eta = self.meter.eta(self.expected - self.transferred)
+        return rate_text(self.meter.rate(), eta)
+
+    def upload(self, file_name):
+        """Queue a document for the tablet, returns straight away"""
+        self._configure()
+        self.core.upload(file_name)
+
+    def _new_settings(self):
+        """idle, suspend and password as typed in"""
+        return (
+            self.tablet_config_layout.idle.text,
+            self.tablet_config_layout.suspend.text,
+            self.tablet_config_layout.password.text.strip()
+        )
+
+    def save_locally(self, *args):
+        """Always run this in the background"""
+        Thread(
+            target=self.core.save_locally, args=self._new_settings()
+        ).start()
+
+    def save_to_tablet(self, *args):
+        """Always run this in the background"""
+        if not self.app_config_lout.old_password.text:
+            self.status_layout.status_label.text = core.NO_LOCAL
+            return
+        self._configure()
+        Thread(
+            target=self._save_to_tablet, args=self._new_settings()
+        ).start()
+
+    def _save_to_tablet(self, idle, suspend, password):
+        """Push the settings, then any templates and splash screens"""
+        if not self.core.push_settings(idle, suspend, password):
+            return
+        self.core.events.publish(events.PASSWORD, password)
+        pushed = self.core.push_templates()
+        if pushed is None:
+            return
+        sent, skipped, skipped_bytes = pushed
+        self.core.events.publish(events.STATUS, core.REMOTE_FILE_SAVED % (
+            sent, skipped, skipped_bytes / 1000000.0
+        ))
+
+    def quit(self, obj):
+        """Exit"""
+        self.status_layout.status_label.text = EXITING
+        self.core.close()
+        core.save_preferences(
+            self.app_config_lout.old_password.text.strip(),
+            self.app_config_lout.get_channels(),
+            self.app_config_lout.get_compression(),
+            self.app_config_lout.get_bandwidth()
+        )
+        sys.exit()
+
+
+class ConfigLabel(Label):
+    """Standarized the configuration labels"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(ConfigLabel, self).__init__(**kwargs)
+        self.lines = self.text.count('\n') + 1
+
+
+class ConfigInput(TextInput):
+    """Standarized the configuration inputs"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(ConfigInput, self).__init__(**kwargs)
+        self.multiline = False
+        self.cursor_blink = True
+        self.write_tab = False
+
+
+class AppConfigLayout(GridLayout):
+    """Two columns in a grid layout, label and input"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(AppConfigLayout, self).__init__(**kwargs)
+        self.cols = 2
+
+        self.add_widget(ConfigLabel(text='IP Address'))
+        self.ipaddress = ConfigInput(text=core.DEFAULT_HOST)
+        self.add_widget(self.ipaddress)
+
+        self.add_widget(ConfigLabel(text='Port'))
+        self.port = ConfigInput(text='22')
+        self.add_widget(self.port)
+
+        self.add_widget(ConfigLabel(text='Username'))
+        self.username = ConfigInput(text='root')
+        self.add_widget(self.username)
+
+        self.add_widget(ConfigLabel(text='Tablet Password'))
+        self.old_password = ConfigInput(password=True)
+        self.add_widget(self.old_password)
+
+        self.add_widget(ConfigLabel(text='Download Channels\n(1 to 16)'))
+        self.channels = ConfigInput(text=str(sync.WORKERS))
+        self.add_widget(self.channels)
+
+        self.add_widget(
+            ConfigLabel(text='Compression\n(auto, on or off)')
+        )
+        self.compression = ConfigInput()
+        self.add_widget(self.compression)
+
+        self.add_widget(
+            ConfigLabel(text='Download Cap MB/s\n(0 for none)')
+        )
+        self.bandwidth = ConfigInput()
+        self.add_widget(self.bandwidth)
+
+        preferences = core.load_preferences()
+        self.old_password.text = preferences['password']
+        self.channels.text = str(preferences['channels'])
+        self.compression.text = preferences['compression']
+        self.bandwidth.text = str(preferences['bandwidth'])
+
+    def get_channels(self):
+        """How many sftp channels to download over at once"""
+        if self.channels.text.strip().isdigit():
+            return max(1, min(int(self.channels.text), sync.MAX_WORKERS))
+        return sync.WORKERS
+
+    def get_compression(self):
+        """auto measures the link on connect and compresses if it is slow"""
+        mode = self.compression.text.strip().lower()
+        if mode in tablet.COMPRESSION_MODES:
+            return mode
+        return tablet.AUTO
+
+    def get_bandwidth(self):
+        """MB/s pulls are held to, 0 for no cap"""
+        try:
+            return max(0.0, float(self.bandwidth.text))
+        except ValueError:
+            return 0
+
+
+class TabletConfigLayout(GridLayout):
+    """Two columns in a grid layout, label and input"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(TabletConfigLayout, self).__init__(**kwargs)
+        self.cols = 2
+
+        self.add_widget(ConfigLabel(text='New Password'))
+        self.password = ConfigInput(password=True)
+        self.add_widget(self.password)
+
+        self.add_widget(
+            Label(
+                text='Idle Time Before Suspend\n(in minutes)',
+                halign='center'
+            )
+        )
+        self.idle = ConfigInput()
+        self.add_widget(self.idle)
+
+        self.add_widget(
+            Label(
+                text='Suspend Time Before Power Off\n(in minutes)',
+                halign='center'
+            )
+        )
+        self.suspend = ConfigInput()
+        self.add_widget(self.suspend)
+
+
+class ButtonRowLayout(BoxLayout):
+    """Buttons in a single row, pass in the controller to bind functions"""
+
+    def __init__(self, app_controller, **kwargs):
+        """Initialize the class"""
+        super(ButtonRowLayout, self).__init__(**kwargs)
+        self.app_controller = app_controller
+        self.orientation = 'horizontal'
+
+        self.recon_btn = Button(text='Reconnect')
+        self.recon_btn.bind(on_press=self.app_controller.reconnect)
+        self.add_widget(self.recon_btn)
+
+        self.save_btn = Button(
+            text='Push Settings, \nTemplates, and Screens',
+            halign='center'
+        )
+        self.save_btn.bind(on_press=self.app_controller.save_to_tablet)
+        self.add_widget(self.save_btn)
+
+        self.back_btn = Button(
+            text='Pull My Files',
+            halign='center'
+        )
+        self.back_btn.bind(on_press=self.app_controller.get_files)
+        self.add_widget(self.back_btn)
+
+        self.full_btn = Button(
+            text='Full Backup',
+            halign='center'
+        )
+        self.full_btn.bind(on_press=self.app_controller.full_backup)
+        self.add_widget(self.full_btn)
+
+        self.quit_btn = Button(text='Quit')
+        self.quit_btn.bind(on_press=self.app_controller.quit)
+        self.add_widget(self.quit_btn)
+
+
+class LazyTabHeader(TabbedPanelHeader):
+    """Tab that only builds its content the first time it is opened"""
+
+    def __init__(self, build, **kwargs):
+        """Initialize the class, build() returns the content"""
+        super(LazyTabHeader, self).__init__(**kwargs)
+        self.build = build
+
+    def on_press(self):
+        """Build the content, then switch to it"""
+        if self.content is None:
+            self.content = self.build()
+        super(LazyTabHeader, self).on_press()
+
+
+class HomeScreen(BoxLayout):
+    """Home screen will have tabs at top and status at bottom"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(HomeScreen, self).__init__(**kwargs)
+        self.orientation = 'vertical'
+
+        self.status_layout = StatusLayout(size_hint=(1, .1))
+        self.tabs = TabbedPanel()
+        app = App.get_running_app()
+        app.tabs = self.tabs
+
+        settings_header = TabbedPanelHeader(text='Assistant\nSettings')
+        settings_header.content = AppSettings(status_layout=self.status_layout)
+        self.tabs.add_widget(settings_header)
+        self.tabs.default_tab = settings_header
+
+        tab_settings_header = TabbedPanelHeader(text='Tablet\nSettings')
+        tab_settings_header.content = TabletSettings(
+            status_layout=self.status_layout
+        )
+        self.tabs.add_widget(tab_settings_header)
+
+        templates_header = LazyTabHeader(Templates, text='Templates')
+        self.tabs.add_widget(templates_header)
+
+        splash_header = LazyTabHeader(Splash, text='Splash\nScreens')
+        self.tabs.add_widget(splash_header)
+
+        friendly_files_header = LazyTabHeader(
+            self._build_friendly_my_files, text='My Files'
+        )
+        self.tabs.add_widget(friendly_files_header)
+
+        self.app_controller = AppController(
+            settings_header.content.config_layout,
+            tab_settings_header.content.config_layout,
+            self.status_layout,
+            friendly_files_header
+        )
+
+        self.add_widget(self.tabs)
+
+        self.buttons = ButtonRowLayout(self.app_controller, size_hint=(1, .1))
+        self.add_widget(self.buttons)
+
+        self.add_widget(self.status_layout)
+
+    def _build_friendly_my_files(self):
+        """My Files shares the controller's index"""
+        return MyFilesPane(
+            index=self.app_controller.index,
+            ready=self.app_controller.library_ready
+        )
+
+
+class Thumbnails(object):
+    """Ready thumbnail textures, decoded off the UI thread"""
+
+    def __init__(self):
+        """Initialize the class"""
+        self.textures = LRUCache()
+        self.waiting = {}
+        self.failed = set()
+        self.service = ThumbnailService(THUMB_DIR, self._decoded)
+        self.previews = PreviewService(PREVIEW_DIR, self._decoded)
+
+    def texture(self, source, callback):
+        """The texture if it is ready, otherwise callback(source, texture)"""
+        # A pull that replaces the file replaces its texture too
+        key = (source, modified(source))
+        texture = self.textures.get(key)
+        if texture is not None or key in self.failed:
+            return texture
+        if source not in self.waiting:
+            self.waiting[source] = (key, [])
+            # Notebooks without thumbnails point at their first page instead
+            if source.endswith('.rm'):
+                self.previews.request(source)
+            else:
+                self.service.request(source)
+        self.waiting[source][1].append(callback)
+        return None
+
+    def _decoded(self, source, size, pixels):
+        """Textures can only be made on the UI thread"""
+        Clock.schedule_once(lambda dt: self._ready(source, size, pixels))
+
+    def _ready(self, source, size, pixels):
+        """Upload the pixels and tell whoever was waiting"""
+        key, callbacks = self.waiting.pop(source, ((source, None), []))
+        if size is None:
+            # They keep the placeholder they already show
+            self.failed.add(key)
+            return
+        texture = Texture.create(size=size, colorfmt='rgba')
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        texture.flip_vertical()
+        self.textures.put(key, texture, len(pixels))
+        for callback in callbacks:
+            callback(source, texture)
+
+
+def modified(path):
+    """mtime of path, None if it isn't there"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class DocumentTile(RecycleDataViewBehavior, BoxLayout):
+    """One recycled cell of the My Files grid"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(DocumentTile, self).__init__(**kwargs)
+        self.orientation = 'vertical'
+        self.thumbnail = None
+        self.image_button = ImageButton(
+            source='static/no_image.png',
+            metadata={},
+            key='',
+            view=None
+        )
+        self.add_widget(self.image_button)
+        self.label = Label(
+            halign='left',
+            size_hint_y=None
+        )
+        self.add_widget(self.label)
+
+    def refresh_view_attrs(self, view, index, data):
+        """Point this recycled cell at another document"""
+        self.image_button.metadata = data['metadata']
+        self.image_button.key = data['key']
+        self.image_button.view = view
+        self.label.text = data['text']
+        self.thumbnail = data['thumbnail']
+        texture = None
+        if self.thumbnail:
+            texture = view.thumbnails.texture(
+                self.thumbnail, self._thumbnail_ready
+            )
+        if texture is not None:
+            self._show_texture(texture)
+        else:
+            self.image_button.source = data['source']
+
+    def _thumbnail_ready(self, source, texture):
+        """Only show it if this cell wasn't recycled in the meantime"""
+        if source == self.thumbnail:
+            self._show_texture(texture)
+
+    def _show_texture(self, texture):
+        """Swap the placeholder for the decoded thumbnail"""
+        self.image_button.source = ''
+        self.image_button.texture = texture
+
+
+class MyFilesPane(BoxLayout):
+    """A search box over the My Files grid"""
+
+    def __init__(self, index, ready, **kwargs):
+        """Initialize the class"""
+        super(MyFilesPane, self).__init__(**kwargs)
+        self.orientation = 'vertical'
+        self.search_box = ConfigInput(
+            hint_text=SEARCH_HINT,
+            size_hint_y=None,
+            height=40
+        )
+        self.add_widget(self.search_box)
+        self.files = FriendlyMyFiles(index, ready, search_box=self.search_box)
+        self.add_widget(self.files)
+
+    def on_dropfile(self, *args):
+        """Dropped documents go to the grid"""
+        self.files.on_dropfile(*args)
+
+
+class FriendlyMyFiles(RecycleView):
+    """Your files but looking better"""
+
+    def __init__(self, index, ready, search_box=None, **kwargs):
+        """Initialize the class, the documents are loaded in the background"""
+        super(FriendlyMyFiles, self).__init__(**kwargs)
+        self.parent_dir = ""
+        self.query = ""
+        self.size_hint = (1, 1)
+        self.index = index
+        self.tree = CollectionTree()
+        self.loaded = False
+        self._stale = False
+        self.search_box = search_box
+        if search_box is not None:
+            search = Clock.create_trigger(self._search, SEARCH_DELAY)
+            search_box.bind(text=lambda box, text: search())
+        self.thumbnails = Thumbnails()
+        self.layout = RecycleGridLayout(
+            cols=self._columns(Window.width),
+            spacing=10,
+            default_size=(None, 300),
+            default_size_hint=(1, None),
+            size_hint_y=None
+        )
+        self.layout.bind(minimum_height=self.layout.setter('height'))
+        self.add_widget(self.layout)
+        self.viewclass = DocumentTile
+        self.show_folder("")
+        Window.bind(on_resize=self._resize)
+        Thread(target=self._load, args=(ready,)).start()
+
+    def _load(self, ready):
+        """Build the tree off the UI thread once the startup scan is done"""
+        ready.wait()
+        self.index.scan(BACKUP_DIR)
+        tree = CollectionTree()
+        tree.load(self.index)
+        Clock.schedule_once(lambda dt: self._loaded(tree))
+
+    def _loaded(self, tree):
+        """Swap in the tree, catch up on anything pulled in the meantime"""
+        self.tree = tree
+        self.loaded = True
+        if self._stale:
+            self.tree.refresh(self.index, BACKUP_DIR)
+        self._redraw()
+
+    def _columns(self, width):
+        """One column per 400 pixels"""
+        return max(1, int(width/400))
+
+    def _resize(self, window, width, height):
+        """Only reflow the columns, the cells get reused"""
+        self.layout.cols = self._columns(width)
+
+    def refresh_widget(self, parent_dir=""):
+        """Pick up changed documents then refresh the screen"""
+        if not self.loaded:
+            self._stale = True
+            return
+        self.tree.refresh(self.index, BACKUP_DIR)
+        if self.query:
+            self._redraw()
+        else:
+            self.show_folder(parent_dir)
+
+    def update_documents(self, keys):
+        """Re-read a few documents, redraw only if the open folder changed"""
+        if not self.loaded:
+            self._stale = self._stale or bool(keys)
+            return
+        touched = False
+        for key in keys:
+            old = self.tree.documents.get(key, {})
+            if not self.index.update(BACKUP_DIR, key):
+                continue
+            metadata, thumbnail = self.index.document(key)
+            self.tree.update(metadata, thumbnail)
+            if self.parent_dir in (metadata.get('parent'), old.get('parent')):
+                touched = True
+        # Search results can change whichever folder the documents are in
+        if touched or self.query:
+            self._redraw()
+
+    def show_folder(self, parent_dir=""):
+        """Refresh the screen"""
+        if parent_dir != self.parent_dir or self.query:
+            self.scroll_y = 1
+        self.parent_dir = parent_dir
+        if self.query:
+            self.query = ""
+            self.search_box.text = ""
+        self.data = self.get_data(parent_dir)
+
+    def _search(self, *args):
+        """Show what matches the search box, the open folder if it's empty"""
+        query = self.search_box.text.strip()
+        if query != self.query:
+            self.query = query
+            self.scroll_y = 1
+            self._redraw()
+
+    def _redraw(self):
+        """Show the search results or the open folder again"""
+        if self.query and self.loaded:
+            self.data = self.get_results(self.query)
+        else:
+            self.data = self.get_data(self.parent_dir)
+
+    def get_results(self, query):
+        """Get the data for the cells of the documents matching query"""
+        return [
+            self._cell(self.tree.documents[key])
+            for key in self.index.search(query)
+            if key in self.tree.documents
+        ]
+
+    def get_data(self, parent_dir):
+        """Get the data for the cells in one folder"""
+        if not self.loaded:
+            return [LOADING_CELL]
+        data = []
+
+        # Create a back if needed
+        if parent_dir:
+            data.append({
+                'source': 'static/dir.png',
+                'metadata': {},
+                'key': '',
+                'text': 'Previous',
+                'thumbnail': None
+            })
+
+        # Add files
+        for metadata in self.tree.children(parent_dir):
+            data.append(self._cell(metadata))
+        return data
+
+    def _cell(self, metadata):
+        """One document's cell"""
+        key = metadata['uuid']
+        source = 'static/no_image.png'
+        thumbnail = None
+        if key in self.tree.thumbnails:
+            thumbnail = BACKUP_DIR + self.tree.thumbnails[key]
+        if metadata['type'] == 'CollectionType':
+            source = 'static/dir.png'
+            thumbnail = None
+        filename = metadata['visibleName']
+        if len(filename) > 26:
+            newfilename = filename[:12] + '...' + filename[-11:]
+            filename = newfilename
+        return {
+            'source': source,
+            'metadata': metadata,
+            'key': key,
+            'text': filename,
+            'thumbnail': thumbnail
+        }
+
+    def on_dropfile(self, *args):
+        """Queue a pdf for the web updload end point"""
+        controller = App.get_running_app().root.app_controller
+        controller.upload(args[2].decode('UTF-8'))
+
+
+class ImageButton(ButtonBehavior, Image):
+    """Images that act like Buttons"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(ImageButton, self).__init__()
+        if 'source' in kwargs:
+            self.source = kwargs['source']
+        if 'metadata' in kwargs:
+            self.metadata = kwargs['metadata']
+        if 'view' in kwargs:
+            self.view = kwargs['view']
+        if 'key' in kwargs:
+            self.key = kwargs['key']
+
+    def on_press(self):
+        """Update the view"""
+        if self.key:
+            if self.metadata['type'] == 'CollectionType':
+                self.view.show_folder(self.key)
+        else:
+            self.view.show_folder('')
+
+
+class Splash(BoxLayout):
+    """You can write over your splash screens"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(Splash, self).__init__(**kwargs)
+        self.orientation = 'vertical'
+        self.file_chooser = FileChooserListView()
+        self.file_chooser.rootpath = SPLASH_DIR
+        self.file_chooser.path = SPLASH_DIR
+        self.file_chooser.multiselect = True
+        self.add_widget(self.file_chooser)
+
+    def on_dropfile(self, *args):
+        """Copy the file to the local directory when a file is dropped here"""
+        copy2(args[2].decode('UTF-8'), SPLASH_DIR)
+        self.file_chooser._update_files()
+
+
+class Templates(BoxLayout):
+    """Only going to copy new templates out to the remarkable"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(Templates, self).__init__(**kwargs)
+        self.orientation = 'vertical'
+        self.file_chooser = FileChooserListView()
+        self.file_chooser.rootpath = TEMPLATE_DIR
+        self.file_chooser.path = TEMPLATE_DIR
+        self.file_chooser.multiselect = True
+        self.add_widget(self.file_chooser)
+
+    def on_dropfile(self, *args):
+        """Copy the file to the local directory when a file is dropped here"""
+        copy2(args[2].decode('UTF-8'), TEMPLATE_DIR)
+        self.file_chooser._update_files()
+
+
+class TabletSettings(BoxLayout):
+    """TabletSettings is a vertical box layout"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(TabletSettings, self).__init__()
+        self.orientation = 'vertical'
+
+        self.status_layout = kwargs['status_layout']
+
+        self.config_layout = TabletConfigLayout()
+        self.add_widget(self.config_layout)
+
+    def on_dropfile(self, *args):
+        """Don't do anything if a file is dropped on this tab"""
+        pass
+
+
+class AppSettings(BoxLayout):
+    """AppSettings is a vertical box layout"""
+
+    def __init__(self, **kwargs):
+        """Initialize the class"""
+        super(AppSettings, self).__init__()
+        self.orientation = 'vertical'
+
+        self.status_layout = kwargs['status_layout']
+
+        self.config_layout = AppConfigLayout()
+        self.add_widget(self.config_layout)
+
+    def on_dropfile(self, *args):
+        """Don't do anything if a file is dropped on this tab"""
+        pass
+
+
+class MyApp(App):
+    """The main application class"""
+
+    def build(self):
+        """Set title and build the HomeScreen (well a layout not a screen)"""
+        core.make_directories()
+        self.title = "reMarkable Assistant"
+        self.tabs = None
+        Window.bind(on_dropfile=self._on_dropfile)
+        return HomeScreen()
+
+    def on_start(self):
+        """Hold the slow startup work until the window has drawn once"""
+        Window.bind(on_flip=self._first_frame)
+
+    def _first_frame(self, *args):
+        """Only the first one"""
+        Window.unbind(on_flip=self._first_frame)
+        self.root.app_controller.start()
+
+    def _on_dropfile(self, *args):
+        """Call the the on_dropfile for the active tab's content"""
+        Thread(
+            target=self.tabs.current_tab.content.on_dropfile(self, *args)
+        ).start()
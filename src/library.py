@@ -0,0 +1,367 @@
+"""Index of the backed up documents so the views don't re-read everything"""
+from bisect import bisect_left
+from bisect import insort
+import json
+import os
+import re
+import sqlite3
+from threading import Lock
+
+COLLECTION = 'CollectionType'
+# Only these get a first page render, PDFs and EPUBs keep the placeholder
+NOTEBOOK_TYPES = ('notebook', '')
+
+# Bump when the tables or what goes in them change, older indexes are
+# dropped and rebuilt
+VERSION = 3
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    uuid TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    thumbs_mtime REAL,
+    thumbnail TEXT,
+    name TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT NOT NULL,
+    uuid TEXT NOT NULL,
+    PRIMARY KEY (token, uuid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tokens_uuid ON tokens (uuid);
+'''
+
+WORD = re.compile(r'\w+')
+# Field searches like type:pdf, tag:work and pages:12 stay one term
+TERM = re.compile(r'[\w:]+')
+SEARCH_LIMIT = 500
+
+
+class MetadataIndex(object):
+    """On disk index of .metadata files keyed by uuid, checked by mtime"""
+
+    def __init__(self, path):
+        """Initialize the class"""
+        self.path = path
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version < VERSION:
+            self._db.executescript(
+                'DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS tokens;'
+            )
+        self._db.executescript(SCHEMA)
+        self._db.execute('PRAGMA user_version = %d' % VERSION)
+        self._db.commit()
+
+    def scan(self, backup_dir):
+        """Re-read what changed since the last scan, return changed, removed"""
+        found = {}
+        thumbs = {}
+        contents = {}
+        for entry in os.scandir(backup_dir):
+            key, _, extension = entry.name.partition('.')
+            if extension == 'metadata' and entry.is_file():
+                found[key] = entry.stat().st_mtime
+            elif extension == 'content' and entry.is_file():
+                contents[key] = entry.stat().st_mtime
+            elif extension == 'thumbnails' and entry.is_dir():
+                thumbs[key] = entry.stat().st_mtime
+            elif not extension and entry.is_dir():
+                # Pages landing in the document's directory move its mtime
+                contents[key] = max(
+                    contents.get(key, 0), entry.stat().st_mtime
+                )
+        for key in found:
+            found[key] = max(found[key], contents.get(key, 0))
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT uuid, mtime, thumbs_mtime FROM documents'
+            )
+            known = dict((row[0], (row[1], row[2])) for row in rows)
+            changed = []
+            for key, mtime in found.items():
+                thumbs_mtime = thumbs.get(key)
+                if known.get(key) == (mtime, thumbs_mtime):
+                    continue
+                if self._load(backup_dir, key, mtime, thumbs_mtime):
+                    changed.append(key)
+            removed = [key for key in known if key not in found]
+            self._db.executemany(
+                'DELETE FROM documents WHERE uuid = ?',
+                [(key,) for key in removed]
+            )
+            self._db.executemany(
+                'DELETE FROM tokens WHERE uuid = ?',
+                [(key,) for key in removed]
+            )
+            self._db.commit()
+        return changed, removed
+
+    def update(self, backup_dir, key):
+        """Re-read a single document, False if it isn't readable yet"""
+        metapath = os.path.join(backup_dir, key + '.metadata')
+        contentpath = os.path.join(backup_dir, key + '.content')
+        thumbdir = os.path.join(backup_dir, key + '.thumbnails')
+        if not os.path.isfile(metapath):
+            return False
+        mtime = os.stat(metapath).st_mtime
+        for path in (contentpath, os.path.join(backup_dir, key)):
+            if os.path.exists(path):
+                mtime = max(mtime, os.stat(path).st_mtime)
+        thumbs_mtime = None
+        if os.path.isdir(thumbdir):
+            thumbs_mtime = os.stat(thumbdir).st_mtime
+        with self._lock:
+            loaded = self._load(backup_dir, key, mtime, thumbs_mtime)
+            self._db.commit()
+        return loaded
+
+    def _load(self, backup_dir, key, mtime, thumbs_mtime):
+        """Read one document into the index, False if it isn't readable yet"""
+        try:
+            metapath = os.path.join(backup_dir, key + '.metadata')
+            with open(metapath, 'r') as metafile:
+                metadata = json.load(metafile)
+        except (IOError, ValueError):
+            return False
+        content = read_content(os.path.join(backup_dir, key + '.content'))
+        thumbnail = None
+        if thumbs_mtime is not None:
+            thumbdir = os.path.join(backup_dir, key + '.thumbnails')
+            names = sorted(os.listdir(thumbdir))
+            if names:
+                thumbnail = key + '.thumbnails/' + names[0]
+        if thumbnail is None and is_notebook(metadata, content):
+            thumbnail = first_page(backup_dir, key, content)
+        name = str(metadata.get('visibleName', ''))
+        self._db.execute(
+            'INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)',
+            (key, mtime, thumbs_mtime, thumbnail, name.lower(),
+             json.dumps(metadata))
+        )
+        self._db.execute('DELETE FROM tokens WHERE uuid = ?', (key,))
+        self._db.executemany(
+            'INSERT OR IGNORE INTO tokens VALUES (?, ?)',
+            [(token, key) for token in tokens(metadata, content)]
+        )
+        return True
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """uuids with every term inside a token, prefix matches first"""
+        terms = TERM.findall(query.lower())
+        if not terms:
+            return []
+        matches = None
+        prefixed = None
+        with self._lock:
+            for term in terms:
+                starts = set(row[0] for row in self._db.execute(
+                    'SELECT uuid FROM tokens WHERE token >= ? AND token < ?',
+                    (term, term + '\uffff')
+                ))
+                within = set(row[0] for row in self._db.execute(
+                    'SELECT DISTINCT uuid FROM tokens WHERE instr(token, ?)',
+                    (term,)
+                ))
+                if matches is None:
+                    matches, prefixed = within, starts
+                else:
+                    matches &= within
+                    prefixed &= starts
+                if not matches:
+                    return []
+            names = dict(self._db.execute('SELECT uuid, name FROM documents'))
+        ranked = sorted(
+            (key for key in matches if key in names),
+            key=lambda key: (key not in prefixed, names[key], key)
+        )
+        return ranked[:limit]
+
+    def metadata(self):
+        """uuid -> metadata dict with the uuid filled in"""
+        with self._lock:
+            rows = self._db.execute('SELECT uuid, metadata FROM documents')
+            documents = {}
+            for key, metadata in rows:
+                documents[key] = json.loads(metadata)
+                documents[key]['uuid'] = key
+        return documents
+
+    def document(self, key):
+        """(metadata, thumbnail) for one uuid, or (None, None)"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT metadata, thumbnail FROM documents WHERE uuid = ?',
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        metadata = json.loads(row[0])
+        metadata['uuid'] = key
+        return metadata, row[1]
+
+    def thumbnails(self):
+        """uuid -> first thumbnail relative to the backup dir"""
+        with self._lock:
+            return dict(self._db.execute(
+                'SELECT uuid, thumbnail FROM documents '
+                'WHERE thumbnail IS NOT NULL'
+            ))
+
+    def close(self):
+        """Close the database"""
+        with self._lock:
+            self._db.close()
+
+
+def read_content(path):
+    """The .content dict, empty if there isn't a readable one"""
+    try:
+        with open(path, 'r') as content_file:
+            content = json.load(content_file)
+    except (IOError, ValueError):
+        return {}
+    return content if isinstance(content, dict) else {}
+
+
+def page_ids(content):
+    """Page ids in order, from either layout of .content"""
+    pages = content.get('pages')
+    if isinstance(pages, list):
+        return [str(page) for page in pages]
+    pages = (content.get('cPages') or {}).get('pages') or []
+    return [str(page.get('id')) for page in pages if isinstance(page, dict)]
+
+
+def is_notebook(metadata, content):
+    """True for handwritten notebooks, not folders or PDFs and EPUBs"""
+    if metadata.get('type') == COLLECTION:
+        return False
+    return str(content.get('fileType', '')).lower() in NOTEBOOK_TYPES
+
+
+def first_page(backup_dir, key, content):
+    """The first page's .rm relative to backup_dir, None if it has none"""
+    names = page_ids(content)[:1] + ['0']
+    for name in names:
+        path = key + '/' + name + '.rm'
+        if os.path.isfile(os.path.join(backup_dir, path)):
+            return path
+    return None
+
+
+def tag_names(content):
+    """Tags are plain strings in older firmware, dicts with a name in newer"""
+    names = []
+    for tag in content.get('tags') or []:
+        if isinstance(tag, dict):
+            tag = tag.get('name', '')
+        names.append(str(tag))
+    return names
+
+
+def tokens(metadata, content):
+    """Words of the name, title and tags, plus type:, tag: and pages:"""
+    found = set(WORD.findall(str(metadata.get('visibleName', '')).lower()))
+    details = content.get('documentMetadata') or {}
+    found.update(WORD.findall(str(details.get('title', '')).lower()))
+    for author in details.get('authors') or []:
+        found.update(WORD.findall(str(author).lower()))
+    file_type = str(content.get('fileType', '')).lower()
+    if file_type:
+        found.update((file_type, 'type:' + file_type))
+    if metadata.get('type') == COLLECTION:
+        found.add('type:folder')
+    for tag in tag_names(content):
+        words = WORD.findall(tag.lower())
+        found.update(words)
+        found.update('tag:' + word for word in words)
+    if content.get('pageCount') is not None:
+        found.add('pages:%s' % content['pageCount'])
+    return found
+
+
+def sort_key(metadata):
+    """Case insensitive name, uuid to break ties"""
+    return str(metadata.get('visibleName', '')).lower(), metadata['uuid']
+
+
+class CollectionTree(object):
+    """Collection uuid -> its pre-sorted folders and documents"""
+
+    def __init__(self):
+        """Initialize the class"""
+        self.documents = {}
+        self.thumbnails = {}
+        self._folders = {}
+        self._files = {}
+        self._placed = {}
+
+    def load(self, index):
+        """Build everything from the index in one go"""
+        self.documents = index.metadata()
+        self.thumbnails = index.thumbnails()
+        self._folders = {}
+        self._files = {}
+        self._placed = {}
+        for metadata in self.documents.values():
+            self._place(metadata)
+        for children in self._folders.values():
+            children.sort()
+        for children in self._files.values():
+            children.sort()
+
+    def _siblings(self, metadata):
+        """The sorted list a document belongs in"""
+        parent = metadata.get('parent', '')
+        if metadata.get('type') == COLLECTION:
+            return self._folders.setdefault(parent, [])
+        return self._files.setdefault(parent, [])
+
+    def _place(self, metadata):
+        """Append to the parent's list, load() sorts afterwards"""
+        children = self._siblings(metadata)
+        item = sort_key(metadata)
+        children.append(item)
+        self._placed[metadata['uuid']] = (children, item)
+
+    def update(self, metadata, thumbnail=None):
+        """Insert or move one document without touching the others"""
+        key = metadata['uuid']
+        self.remove(key)
+        self.documents[key] = metadata
+        if thumbnail:
+            self.thumbnails[key] = thumbnail
+        children = self._siblings(metadata)
+        item = sort_key(metadata)
+        insort(children, item)
+        self._placed[key] = (children, item)
+
+    def remove(self, key):
+        """Drop one document"""
+        placed = self._placed.pop(key, None)
+        if placed is not None:
+            children, item = placed
+            position = bisect_left(children, item)
+            if position < len(children) and children[position] == item:
+                del children[position]
+        self.documents.pop(key, None)
+        self.thumbnails.pop(key, None)
+
+    def refresh(self, index, backup_dir):
+        """Apply whatever changed on disk since the last look"""
+        changed, removed = index.scan(backup_dir)
+        for key in removed:
+            self.remove(key)
+        for key in changed:
+            metadata, thumbnail = index.document(key)
+            if metadata is not None:
+                self.update(metadata, thumbnail)
+        return changed, removed
+
+    def children(self, parent):
+        """Folders then documents directly inside parent, both sorted"""
+        keys = [item[1] for item in self._folders.get(parent, [])]
+        keys.extend(item[1] for item in self._files.get(parent, []))
+        return [self.documents[key] for key in keys]
@@ -0,0 +1,193 @@
+"""Timings of every transfer, totalled per operation and kept as JSON lines"""
+from collections import deque
+import json
+from threading import Lock
+import time
+import uuid
+
+WINDOW = 5.0
+
+SFTP_GET = 'sftp get'
+SFTP_PUT = 'sftp put'
+LISTING = 'listing'
+CHECKSUMS = 'checksums'
+TAR = 'tar stream'
+HTTP_UPLOAD = 'http upload'
+CONFIG_READ = 'config read'
+CONFIG_WRITE = 'config write'
+
+
+class Timer(object):
+    """Times one operation, set bytes and retries on it before it ends"""
+
+    def __init__(self, metrics, operation, fields):
+        """Initialize the class"""
+        self.metrics = metrics
+        self.operation = operation
+        self.fields = fields
+        self.bytes = 0
+        self.retries = 0
+        self.start = None
+
+    def __enter__(self):
+        """Start the clock"""
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Record it, failed or not, and let any error through"""
+        error = None
+        if exc_value is not None:
+            error = '%s: %s' % (exc_type.__name__, exc_value)
+        self.metrics.record(
+            self.operation,
+            self.bytes,
+            time.time() - self.start,
+            self.retries,
+            error,
+            **self.fields
+        )
+        return False
+
+
+class Metrics(object):
+    """One session's transfers, totalled per operation, logged to path"""
+
+    def __init__(self, path=None):
+        """Initialize the class"""
+        self.path = path
+        self.session = uuid.uuid4().hex
+        self.started = time.time()
+        self.totals = {}
+        self._lock = Lock()
+        self._file = None
+
+    def timer(self, operation, **fields):
+        """with metrics.timer(SFTP_GET, path=...) as timer: timer.bytes = n"""
+        return Timer(self, operation, fields)
+
+    def record(self, operation, nbytes=0, seconds=0.0, retries=0, error=None,
+               **fields):
+        """Count one finished operation and log it"""
+        with self._lock:
+            totals = self.totals.setdefault(operation, [0, 0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += nbytes
+            totals[2] += seconds
+            totals[3] += retries
+            totals[4] += 1 if error else 0
+        line = dict(
+            type='transfer',
+            operation=operation,
+            bytes=nbytes,
+            seconds=round(seconds, 6),
+            rate=rate(nbytes, seconds),
+            retries=retries,
+            error=error
+        )
+        line.update(fields)
+        self._write(line)
+
+    def describe(self, **fields):
+        """Log what the session is talking to, host, firmware and so on"""
+        line = dict(type='session')
+        line.update(fields)
+        self._write(line)
+
+    def summary(self):
+        """operation -> count, bytes, seconds, rate, retries and errors"""
+        with self._lock:
+            totals = dict(self.totals)
+        return dict(
+            (operation, dict(
+                count=count,
+                bytes=nbytes,
+                seconds=round(seconds, 6),
+                rate=rate(nbytes, seconds),
+                retries=retries,
+                errors=errors
+            ))
+            for operation, (count, nbytes, seconds, retries, errors)
+            in totals.items()
+        )
+
+    def close(self):
+        """Log the session totals and close the file"""
+        elapsed = round(time.time() - self.started, 6)
+        for operation, totals in sorted(self.summary().items()):
+            line = dict(type='summary', operation=operation, elapsed=elapsed)
+            line.update(totals)
+            self._write(line)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, line):
+        """Append one JSON line, tagged with the session and the time"""
+        if not self.path:
+            return
+        line['session'] = self.session
+        line['time'] = round(time.time(), 3)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(line, sort_keys=True) + '\n')
+            self._file.flush()
+
+
+def rate(nbytes, seconds):
+    """Bytes per second, 0 when nothing was timed"""
+    if seconds <= 0:
+        return 0.0
+    return round(nbytes / seconds, 1)
+
+
+class RateMeter(object):
+    """Bytes per second over the last few seconds"""
+
+    def __init__(self, window=WINDOW):
+        """Initialize the class"""
+        self.window = window
+        self.started = time.time()
+        self.samples = deque()
+        self.recent = 0
+        self.total = 0
+
+    def add(self, nbytes):
+        """Count bytes that just arrived"""
+        now = time.time()
+        self.samples.append((now, nbytes))
+        self.recent += nbytes
+        self.total += nbytes
+        self._expire(now)
+
+    def _expire(self, now):
+        """Forget samples older than the window"""
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.recent -= self.samples.popleft()[1]
+
+    def rate(self):
+        """Recent bytes per second"""
+        now = time.time()
+        self._expire(now)
+        span = now - max(self.started, now - self.window)
+        if span <= 0:
+            return 0.0
+        return self.recent / span
+
+    def eta(self, remaining):
+        """Seconds left at the recent rate, None if it can't be told"""
+        current = self.rate()
+        if remaining <= 0 or current <= 0:
+            return None
+        return remaining / current
+
+
+def rate_text(bytes_per_second, seconds_left=None):
+    """1.2 MB/s, 0:42 left"""
+    text = '%.1f MB/s' % (bytes_per_second / 1000000.0)
+    if seconds_left is not None:
+        minutes, seconds = divmod(int(seconds_left), 60)
+        text += ', %d:%02d left' % (minutes, seconds)
+    return text
@@ -0,0 +1,162 @@
+"""Draw the first page of notebooks the tablet never made thumbnails for"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import os
+from queue import LifoQueue
+import struct
+from threading import Lock
+from threading import Thread
+
+import numpy
+from PIL import Image
+from PIL import ImageDraw
+
+from thumbnails import THUMB_SIZE
+
+HEADER = b'reMarkable .lines file, version='
+HEADER_SIZE = 43
+PAGE_SIZE = (1404, 1872)
+# x, y, speed, direction, width and pressure of every point, all float32
+POINT = numpy.dtype('<f4')
+POINT_FIELDS = 6
+LAYERS = struct.Struct('<I')
+STROKE_HEADERS = {
+    3: struct.Struct('<IIIfI'),
+    5: struct.Struct('<IIIfII'),
+}
+ERASERS = (6, 8)
+HIGHLIGHTERS = (5, 18)
+INK = 0
+HIGHLIGHT = 200
+PAPER = 255
+
+# What a damaged or unsupported page can raise on its way back from a worker
+BAD_PAGE = (ValueError, struct.error)
+RENDER_ERRORS = (IOError, BrokenProcessPool) + BAD_PAGE
+
+
+def strokes(data):
+    """(pen, width, n x 2 array of x and y) of every stroke on a page"""
+    # Firmware 3 writes version 6, a different format, those are refused
+    if not data.startswith(HEADER):
+        raise ValueError('not a .lines file')
+    version = int(data[len(HEADER):HEADER_SIZE].strip() or 0)
+    if version not in STROKE_HEADERS:
+        raise ValueError('.lines version %d is not supported' % version)
+    stroke_header = STROKE_HEADERS[version]
+    offset = HEADER_SIZE
+    found = []
+    layers, = LAYERS.unpack_from(data, offset)
+    offset += LAYERS.size
+    for _ in range(layers):
+        count, = LAYERS.unpack_from(data, offset)
+        offset += LAYERS.size
+        for _ in range(count):
+            fields = stroke_header.unpack_from(data, offset)
+            offset += stroke_header.size
+            pen, width, points = fields[0], fields[3], fields[-1]
+            # One read per stroke, the points are never touched one by one
+            values = numpy.frombuffer(
+                data, dtype=POINT, count=points * POINT_FIELDS, offset=offset
+            ).reshape(points, POINT_FIELDS)
+            offset += values.nbytes
+            found.append((pen, width, values[:, :2]))
+    return found
+
+
+def render(data, size=THUMB_SIZE):
+    """Greyscale image of one page scaled to fit in size"""
+    scale = min(
+        size[0] / float(PAGE_SIZE[0]), size[1] / float(PAGE_SIZE[1])
+    )
+    image = Image.new('L', (
+        int(round(PAGE_SIZE[0] * scale)), int(round(PAGE_SIZE[1] * scale))
+    ), PAPER)
+    draw = ImageDraw.Draw(image)
+    for pen, width, points in strokes(data):
+        if pen in ERASERS or not len(points):
+            continue
+        fill = HIGHLIGHT if pen in HIGHLIGHTERS else INK
+        line = (points * scale).ravel().tolist()
+        if len(points) == 1:
+            draw.point(line, fill=fill)
+        else:
+            draw.line(
+                line, fill=fill, width=max(1, int(round(width * scale)))
+            )
+    return image
+
+
+def render_file(source, target):
+    """Render source to a PNG at target, runs in the worker processes"""
+    with open(source, 'rb') as page:
+        image = render(page.read())
+    image.save(target + '.part', 'PNG')
+    os.replace(target + '.part', target)
+    return target
+
+
+class PreviewService(object):
+    """Render pages in worker processes, keep them on disk by content hash"""
+
+    def __init__(self, cache_dir, deliver, workers=2):
+        """Initialize the class, deliver(source, size, rgba) gets results,
+        size and rgba are None for a page that can't be drawn"""
+        self.cache_dir = cache_dir
+        self.deliver = deliver
+        self.workers = workers
+        self._pool = None
+        self._lock = Lock()
+        self._queue = LifoQueue()
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        for _ in range(workers):
+            thread = Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def request(self, source):
+        """Queue a page, the most recent requests go first"""
+        self._queue.put(source)
+
+    def cache_path(self, source):
+        """Rendered copy on disk, keyed by what is in the page"""
+        with open(source, 'rb') as page:
+            key = hashlib.sha1(page.read()).hexdigest()
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def _work(self):
+        """Worker loop"""
+        while True:
+            source = self._queue.get()
+            try:
+                size, pixels = self.load(source)
+            except RENDER_ERRORS:
+                size, pixels = None, None
+            self.deliver(source, size, pixels)
+
+    def _processes(self):
+        """The process pool, started on the first page that isn't cached"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def load(self, source):
+        """(size, rgba bytes) from the disk cache or a fresh render"""
+        cached = self.cache_path(source)
+        # Pages that failed once, firmware 3 ones say, aren't tried again
+        failed = cached[:-len('.png')] + '.failed'
+        if os.path.exists(failed):
+            raise ValueError('%s could not be drawn' % source)
+        if not os.path.exists(cached):
+            try:
+                self._processes().submit(
+                    render_file, source, cached
+                ).result()
+            except BAD_PAGE:
+                open(failed, 'w').close()
+                raise
+        image = Image.open(cached).convert('RGBA')
+        return image.size, image.tobytes()
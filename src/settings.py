@@ -0,0 +1,110 @@
+"""xochitl.conf held in memory, edited in place and written back atomically"""
+import hashlib
+from shlex import quote
+
+GENERAL = 'General'
+IDLE_KEY = 'IdleSuspendDelay'
+SUSPEND_KEY = 'SuspendPowerOffDelay'
+DEVPASS_KEY = 'DeveloperPassword'
+
+READ = 'cat %s'
+# Refuse if xochitl rewrote the file since it was read, then swap it in whole
+WRITE = '[ "$(md5sum < %(path)s | cut -c1-32)" = %(base)s ] || exit 3; ' \
+    'cat > %(temp)s && sync && mv %(temp)s %(path)s && md5sum < %(path)s'
+CHANGED_ON_TABLET = 3
+
+
+class ConfigChanged(Exception):
+    """The tablet's copy moved on since it was read"""
+
+
+class IniFile(object):
+    """Lines of an ini file, only the edited ones change when written back"""
+
+    def __init__(self, text=''):
+        """Initialize the class"""
+        self.lines = text.splitlines(True)
+        if self.lines and not self.lines[-1].endswith('\n'):
+            self.lines[-1] += '\n'
+        self.dirty = False
+
+    def _find(self, key, section):
+        """(line index of key or None, index a new key would go at)"""
+        current = None
+        insert_at = None
+        for number, line in enumerate(self.lines):
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                current = stripped[1:-1]
+                if current == section:
+                    insert_at = number + 1
+                continue
+            if current != section or not stripped or stripped[0] in ';#':
+                continue
+            name, separator, _ = stripped.partition('=')
+            if separator and name.strip() == key:
+                return number, insert_at
+            insert_at = number + 1
+        return None, insert_at
+
+    def get(self, key, section=GENERAL, default=None):
+        """The value of key exactly, not of keys it is a prefix of"""
+        number, _ = self._find(key, section)
+        if number is None:
+            return default
+        return self.lines[number].partition('=')[2].strip()
+
+    def set(self, key, value, section=GENERAL):
+        """Change one value, True if it wasn't already that"""
+        value = str(value)
+        if self.get(key, section) == value:
+            return False
+        number, insert_at = self._find(key, section)
+        line = '%s=%s\n' % (key, value)
+        if number is not None:
+            self.lines[number] = line
+        elif insert_at is not None:
+            self.lines.insert(insert_at, line)
+        else:
+            self.lines.extend(['[%s]\n' % section, line])
+        self.dirty = True
+        return True
+
+    def text(self):
+        """The whole file"""
+        return ''.join(self.lines)
+
+
+def checksum(data):
+    """md5 of bytes, as md5sum prints it"""
+    return hashlib.md5(data).hexdigest()
+
+
+def read_config(connection, path):
+    """(IniFile, md5) of the tablet's config in one exec round trip"""
+    exit_status, output, error = connection.run(READ % quote(path))
+    if exit_status != 0:
+        raise IOError(error.decode('utf-8', 'replace').strip() or path)
+    return IniFile(output.decode('utf-8')), checksum(output)
+
+
+def write_config(connection, config, base, path):
+    """Swap in the edited config if the tablet's is still base, new md5"""
+    data = config.text().encode('utf-8')
+    exit_status, output, error = connection.run(
+        WRITE % {
+            'path': quote(path),
+            'temp': quote(path + '.tmp'),
+            'base': quote(base)
+        },
+        stdin=data
+    )
+    if exit_status == CHANGED_ON_TABLET:
+        raise ConfigChanged(path)
+    if exit_status != 0:
+        raise IOError(error.decode('utf-8', 'replace').strip() or path)
+    written = output.decode('utf-8', 'replace')[:32]
+    if written != checksum(data):
+        raise IOError('%s did not arrive intact' % path)
+    config.dirty = False
+    return written
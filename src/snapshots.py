@@ -0,0 +1,132 @@
+"""Dated snapshots of the backup, every file's content stored only once
+
+    root/objects/ab/abcdef...   one file per distinct md5, hard linked in
+    root/manifests/NAME.json    relative path -> md5, size, mtime
+    root/index.json             NAME -> when, how many files, how big
+"""
+import os
+from shutil import copy2
+from threading import Lock
+import time
+
+from sync import HashCache
+from sync import read_json
+from sync import write_json
+
+NAME_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def _link_or_copy(source, target):
+    """Hard link, or copy where links aren't possible (FAT, other disks)"""
+    temp_path = target + '.part'
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        copy2(source, temp_path)
+    os.replace(temp_path, target)
+
+
+class SnapshotStore(object):
+    """Content addressed objects plus one small manifest per snapshot"""
+
+    def __init__(self, root):
+        """Initialize the class"""
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.manifests = os.path.join(root, 'manifests')
+        self.index_file = os.path.join(root, 'index.json')
+        self.hashes = HashCache(os.path.join(root, 'hashes.json'))
+        self._lock = Lock()
+        for directory in (self.objects, self.manifests):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        self.index = read_json(self.index_file, {})
+
+    def object_path(self, md5):
+        """Where the content with this md5 lives"""
+        return os.path.join(self.objects, md5[:2], md5)
+
+    def take(self, source_dir, paths, stopped=None):
+        """Snapshot paths under source_dir, (name, new objects, new bytes)"""
+        files = {}
+        new_objects = []
+        for path in sorted(paths):
+            if stopped and stopped():
+                return None, 0, 0
+            local_path = os.path.join(source_dir, path)
+            if not os.path.isfile(local_path):
+                continue
+            stats = os.stat(local_path)
+            md5 = self.hashes.md5(local_path)
+            files[path] = [md5, stats.st_size, stats.st_mtime]
+            stored = self.object_path(md5)
+            if not os.path.exists(stored):
+                if not os.path.exists(os.path.dirname(stored)):
+                    os.makedirs(os.path.dirname(stored))
+                _link_or_copy(local_path, stored)
+                new_objects.append(stats.st_size)
+        self.hashes.save()
+        # A pull that changed nothing doesn't need a snapshot of its own
+        latest = self.latest()
+        if latest and self.load(latest) == files:
+            return None, 0, 0
+        with self._lock:
+            name = base = time.strftime(NAME_FORMAT, time.gmtime())
+            suffix = 1
+            while name in self.index:
+                suffix += 1
+                name = '%s-%d' % (base, suffix)
+            write_json(os.path.join(self.manifests, name + '.json'), files)
+            self.index[name] = {
+                'time': time.time(),
+                'files': len(files),
+                'bytes': sum(entry[1] for entry in files.values())
+            }
+            write_json(self.index_file, self.index)
+        return name, len(new_objects), sum(new_objects)
+
+    def names(self):
+        """Every snapshot, oldest first"""
+        with self._lock:
+            return sorted(self.index)
+
+    def latest(self):
+        """The newest snapshot's name, None before the first"""
+        names = self.names()
+        return names[-1] if names else None
+
+    def load(self, name):
+        """relative path -> [md5, size, mtime] of one snapshot"""
+        path = os.path.join(self.manifests, name + '.json')
+        if not os.path.isfile(path):
+            raise KeyError(name)
+        return read_json(path, {})
+
+    def diff(self, old, new):
+        """(added, removed, changed) paths between two snapshots"""
+        before = self.load(old)
+        after = self.load(new)
+        added = sorted(path for path in after if path not in before)
+        removed = sorted(path for path in before if path not in after)
+        changed = sorted(
+            path for path in after
+            if path in before and after[path][0] != before[path][0]
+        )
+        return added, removed, changed
+
+    def restore(self, name, target_dir, link=False):
+        """Rebuild a snapshot under target_dir, return the files written"""
+        # Linked files share the stored objects, editing one in place
+        # would change every snapshot that has it
+        files = self.load(name)
+        for path, (md5, _, mtime) in sorted(files.items()):
+            target = os.path.join(target_dir, path)
+            if not os.path.exists(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            if link:
+                _link_or_copy(self.object_path(md5), target)
+            else:
+                copy2(self.object_path(md5), target + '.part')
+                os.replace(target + '.part', target)
+                os.utime(target, (mtime, mtime))
+        return len(files)
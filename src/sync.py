@@ -0,0 +1,795 @@
+"""Keep the local backup of the tablet documents in step with the tablet"""
+import hashlib
+import json
+import os
+import posixpath
+from queue import Empty
+from queue import PriorityQueue
+from shlex import quote
+import tarfile
+import tempfile
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+
+from metrics import LISTING
+from metrics import SFTP_GET
+from metrics import SFTP_PUT
+from metrics import TAR
+from tablet import LINK_ERRORS
+from tablet import RemoteEntry
+from tablet import dropped
+from tablet import list_paths
+from tablet import list_tree
+from tablet import remote_checksums
+
+SAVE_EVERY = 200
+WORKERS = 4
+MAX_WORKERS = 16
+TAR_CHECK = 'command -v tar'
+GZIP_CHECK = 'command -v tar && command -v gzip'
+DOCUMENT_FILES = ('.metadata', '.content', '.pdf', '.epub', '.thumbnails')
+CHUNK = 65536
+
+# Pull classes, lower goes first, so the grid fills in before the bulk
+METADATA = 0
+THUMBNAILS = 1
+PAGES = 2
+BULK = 3
+METADATA_TYPES = ('metadata', 'content', 'pagedata')
+BULK_TYPES = ('pdf', 'epub')
+LARGE = 4 * 1024 * 1024
+# The same classes as find tests for the tar stream, priority() must agree
+FIND_METADATA = "\\( -name '*.metadata' -o -name '*.content' " \
+    "-o -name '*.pagedata' \\)"
+FIND_THUMBNAILS = "-path '*.thumbnails/*'"
+FIND_BULK = "\\( -name '*.pdf' -o -name '*.epub' -o -size +%dk \\)" % (
+    LARGE // 1024
+)
+FIND_CLASSES = (
+    FIND_METADATA,
+    '! %s %s' % (FIND_METADATA, FIND_THUMBNAILS),
+    '! %s ! %s ! %s' % (FIND_METADATA, FIND_THUMBNAILS, FIND_BULK),
+    '! %s ! %s %s' % (FIND_METADATA, FIND_THUMBNAILS, FIND_BULK),
+)
+TAR_CLASS = 'find %s -type f %s -exec tar -cf - {} +'
+# Reads go out a window at a time, as many requests as fit in flight at once
+WINDOW = 1024 * 1024
+REQUEST = 32768
+# Fetches again when the md5 doesn't match the tablet's before giving up
+VERIFY_RETRIES = 2
+# The tablet sums this many files or bytes per exec, ahead of the workers
+SUM_FILES = 200
+SUM_BYTES = 32 * 1024 * 1024
+
+
+def read_json(path, default):
+    """The JSON at path, default if it is missing or broken"""
+    try:
+        with open(path, 'r') as source:
+            return json.load(source)
+    except (IOError, ValueError):
+        return default
+
+
+def write_json(path, value):
+    """Write next to path and move it into place"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as output:
+        json.dump(value, output, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+class SyncManifest(object):
+    """Remote path -> size and mtime of every file already pulled"""
+
+    def __init__(self, path):
+        """Initialize the class"""
+        self.path = path
+        self.entries = {}
+        self._lock = Lock()
+        self.load()
+
+    def load(self):
+        """Read the manifest, a missing or broken one means pull everything"""
+        self.entries = read_json(self.path, {})
+
+    def save(self):
+        """Write the manifest next to itself and move it into place"""
+        with self._lock:
+            write_json(self.path, self.entries)
+
+    def paths(self):
+        """Every recorded path, safe to walk while pulls update it"""
+        with self._lock:
+            return list(self.entries)
+
+    def is_current(self, remote_file, local_directory):
+        """True if the local copy is the one the tablet has"""
+        entry = self.entries.get(remote_file.path)
+        if entry != [remote_file.size, remote_file.mtime]:
+            return False
+        local_path = os.path.join(local_directory, remote_file.path)
+        return (os.path.isfile(local_path) and
+                os.path.getsize(local_path) == remote_file.size)
+
+    def update(self, remote_file):
+        """Record a file that was just pulled"""
+        with self._lock:
+            self.entries[remote_file.path] = [
+                remote_file.size, remote_file.mtime
+            ]
+
+    def remove(self, path):
+        """Forget a file"""
+        with self._lock:
+            self.entries.pop(path, None)
+
+    def plan(self, remote_files, local_directory):
+        """Split into files to fetch, unchanged files and stale local paths"""
+        fetch = []
+        unchanged = []
+        for remote_file in remote_files:
+            if self.is_current(remote_file, local_directory):
+                unchanged.append(remote_file)
+            else:
+                fetch.append(remote_file)
+        remote_paths = set(remote_file.path for remote_file in remote_files)
+        with self._lock:
+            stale = [path for path in self.entries if path not in remote_paths]
+        return fetch, unchanged, stale
+
+
+class HashCache(object):
+    """Local path -> size, mtime and md5, so files are hashed once"""
+
+    def __init__(self, path):
+        """Initialize the class"""
+        self.path = path
+        self.entries = read_json(path, {})
+        self._lock = Lock()
+
+    def md5(self, local_path):
+        """md5 of local_path, only read again if its size or mtime moved"""
+        stats = os.stat(local_path)
+        key = os.path.abspath(local_path)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry and entry[:2] == [stats.st_size, stats.st_mtime]:
+            return entry[2]
+        checksum = file_md5(local_path)
+        with self._lock:
+            self.entries[key] = [stats.st_size, stats.st_mtime, checksum]
+        return checksum
+
+    def record(self, local_path, checksum):
+        """Remember the md5 of a file hashed on its way in"""
+        stats = os.stat(local_path)
+        with self._lock:
+            self.entries[os.path.abspath(local_path)] = [
+                stats.st_size, stats.st_mtime, checksum
+            ]
+
+    def save(self):
+        """Write the cache next to itself and move it into place"""
+        with self._lock:
+            write_json(self.path, self.entries)
+
+
+def file_md5(local_path):
+    """md5 of a local file read in chunks"""
+    digest = hashlib.md5()
+    with open(local_path, 'rb') as local_file:
+        for chunk in iter(lambda: local_file.read(CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def push(connection, pairs, hashes, status=None):
+    """Upload the (local, remote) pairs the tablet doesn't already have"""
+    checksums = remote_checksums(connection, [remote for _, remote in pairs])
+    sent = 0
+    skipped = 0
+    skipped_bytes = 0
+    sftp = connection.sftp()
+    for local_path, remote_path in pairs:
+        if checksums.get(remote_path) == hashes.md5(local_path):
+            skipped += 1
+            skipped_bytes += os.path.getsize(local_path)
+            continue
+        if status:
+            status(os.path.basename(local_path))
+        with connection.metrics.timer(SFTP_PUT, path=remote_path) as timer:
+            timer.bytes = sftp.put(local_path, remote_path).st_size
+        sent += 1
+    hashes.save()
+    return sent, skipped, skipped_bytes
+
+
+def priority(remote_file):
+    """The class a file is pulled in, see FIND_CLASSES"""
+    path = remote_file.path
+    extension = posixpath.basename(path).rpartition('.')[2]
+    if extension in METADATA_TYPES:
+        return METADATA
+    if '.thumbnails/' in path:
+        return THUMBNAILS
+    if extension in BULK_TYPES or remote_file.size > LARGE:
+        return BULK
+    return PAGES
+
+
+class Throttle(object):
+    """A byte budget shared by every reader, refilled at rate per second"""
+
+    def __init__(self, rate):
+        """Initialize the class, rate in bytes per second"""
+        self.rate = float(rate)
+        self._next = time.time()
+        self._lock = Lock()
+
+    def take(self, nbytes):
+        """Wait until nbytes more fit under the cap"""
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + nbytes / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class CorruptDownload(IOError):
+    """The local copy's md5 isn't the tablet's"""
+
+
+def pipelined_get(sftp, remote_path, local_path, window=WINDOW,
+                  throttle=None):
+    """Copy a file in windows of pipelined reads, return its md5"""
+    digest = hashlib.md5()
+    with sftp.open(remote_path, 'rb') as remote, \
+            open(local_path, 'wb') as local:
+        size = remote.stat().st_size
+        for start in range(0, size, window):
+            end = min(start + window, size)
+            # Each window is paid for before any of it is asked for
+            if throttle is not None:
+                throttle.take(end - start)
+            chunks = [
+                (offset, min(REQUEST, end - offset))
+                for offset in range(start, end, REQUEST)
+            ]
+            for data in remote.readv(chunks):
+                local.write(data)
+                digest.update(data)
+    return digest.hexdigest()
+
+
+def download(sftp, remote_directory, local_directory, remote_file,
+             throttle=None, window=WINDOW, expected=None):
+    """Fetch one file next to its target, check it, stamp the mtime, move
+    it in, return its md5"""
+    local_path = os.path.join(local_directory, remote_file.path)
+    temp_path = part_path(local_path)
+    try:
+        checksum = pipelined_get(
+            sftp, remote_directory + '/' + remote_file.path, temp_path,
+            window, throttle
+        )
+        if expected is not None and checksum != expected:
+            raise CorruptDownload(
+                '%s did not arrive intact' % remote_file.path
+            )
+        os.utime(temp_path, (remote_file.mtime, remote_file.mtime))
+        os.replace(temp_path, local_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+    return checksum
+
+
+def part_path(local_path):
+    """A new .part file next to local_path that no other transfer writes"""
+    handle, temp_path = tempfile.mkstemp(
+        suffix='.part',
+        prefix=os.path.basename(local_path) + '.',
+        dir=os.path.dirname(local_path)
+    )
+    os.close(handle)
+    return temp_path
+
+
+def discard(temp_path):
+    """Remove a .part file that didn't make it, if it is still there"""
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+
+def sum_batches(remote_files):
+    """Split files, keeping their order, into batches for one md5sum exec"""
+    batches = []
+    batch = []
+    size = 0
+    for remote_file in remote_files:
+        if batch and (len(batch) >= SUM_FILES or
+                      size + remote_file.size > SUM_BYTES):
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(remote_file)
+        size += remote_file.size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class Downloader(object):
+    """A bounded pool of workers, each pulling over its own sftp channel"""
+
+    def __init__(self, connection, remote_directory, local_directory,
+                 workers=WORKERS, status=None, stopped=None, throttle=None,
+                 window=WINDOW, hashes=None):
+        """Initialize the class, hashes is a HashCache to record md5s in"""
+        self.connection = connection
+        self.remote_directory = remote_directory
+        self.local_directory = local_directory
+        self.workers = max(1, min(int(workers), MAX_WORKERS))
+        self.status = status
+        self.stopped = stopped
+        self.throttle = throttle
+        self.window = window
+        self.hashes = hashes
+        self.checksums = {}
+        self._queue = PriorityQueue()
+        self._lock = Lock()
+        self._errors = []
+        self._batches = []
+        self._batch_of = {}
+        self._sum_failed = False
+
+    def _halted(self):
+        """Stop when asked to or when another worker failed"""
+        return bool(self._errors) or bool(self.stopped and self.stopped())
+
+    def run(self, remote_files, done=None):
+        """Download everything, call done(remote_file) as each one lands"""
+        # Metadata first, small before large within a class
+        keyed = sorted(
+            (priority(remote_file), remote_file.size, remote_file.path,
+             remote_file)
+            for remote_file in remote_files
+        )
+        for item in keyed:
+            self._queue.put(item)
+        self._plan_sums([item[-1] for item in keyed])
+        summer = Thread(target=self._sum)
+        summer.daemon = True
+        summer.start()
+        threads = []
+        for _ in range(min(self.workers, len(remote_files))):
+            thread = Thread(target=self._work, args=(done,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        summer.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _work(self, done):
+        """Worker loop, one channel for the life of the worker"""
+        sftp = None
+        try:
+            sftp = self.connection.open_sftp()
+            while not self._halted():
+                try:
+                    remote_file = self._queue.get_nowait()[-1]
+                except Empty:
+                    break
+                if self.status:
+                    self.status(remote_file.path)
+                sftp = self._fetch(sftp, remote_file)
+                if done:
+                    with self._lock:
+                        done(remote_file)
+        except Exception as error:
+            self._errors.append(error)
+        finally:
+            if sftp is not None:
+                sftp.close()
+
+    def _plan_sums(self, remote_files):
+        """Split the files, in the order they go, into checksum batches"""
+        self.checksums = {}
+        self._batches = []
+        self._batch_of = {}
+        self._sum_failed = False
+        for batch in sum_batches(remote_files):
+            for remote_file in batch:
+                self._batch_of[remote_file.path] = len(self._batches)
+            self._batches.append((batch, Event()))
+
+    def _sum(self):
+        """Have the tablet sum each batch while the one before downloads"""
+        try:
+            for batch, summed in self._batches:
+                if self._halted():
+                    break
+                try:
+                    checksums = self._remote_checksums(batch)
+                except LINK_ERRORS:
+                    # A dropped link comes back on the next exec
+                    checksums = self._remote_checksums(batch)
+                with self._lock:
+                    self.checksums.update(checksums)
+                summed.set()
+        except Exception:
+            # The workers sum their own files instead
+            self._sum_failed = True
+        finally:
+            for _, summed in self._batches:
+                summed.set()
+
+    def _expected(self, remote_file):
+        """The tablet's md5 of a file, once its batch has been summed"""
+        self._batches[self._batch_of[remote_file.path]][1].wait()
+        with self._lock:
+            if remote_file.path in self.checksums or not self._sum_failed:
+                return self.checksums.get(remote_file.path)
+        checksums = self._remote_checksums([remote_file])
+        with self._lock:
+            self.checksums.update(checksums)
+        return checksums.get(remote_file.path)
+
+    def _remote_checksums(self, remote_files):
+        """Relative path -> the tablet's md5, all in one exec"""
+        prefix = self.remote_directory + '/'
+        checksums = remote_checksums(
+            self.connection,
+            [prefix + remote_file.path for remote_file in remote_files]
+        )
+        return dict(
+            (path[len(prefix):], checksum)
+            for path, checksum in checksums.items()
+        )
+
+    def _fetch(self, sftp, remote_file):
+        """Download one file, on a fresh channel once if the link dropped"""
+        with self.connection.metrics.timer(
+                SFTP_GET, path=remote_file.path) as timer:
+            timer.bytes = remote_file.size
+            try:
+                self._verified(sftp, remote_file, timer)
+            except LINK_ERRORS:
+                if not dropped(sftp):
+                    raise
+                timer.retries += 1
+                sftp.close()
+                sftp = self.connection.open_sftp()
+                self._verified(sftp, remote_file, timer)
+        return sftp
+
+    def _verified(self, sftp, remote_file, timer):
+        """Download until the copy matches the tablet's md5"""
+        attempts = 0
+        expected = self._expected(remote_file)
+        while True:
+            try:
+                checksum = download(
+                    sftp, self.remote_directory, self.local_directory,
+                    remote_file, self.throttle, self.window, expected
+                )
+                break
+            except CorruptDownload:
+                attempts += 1
+                if attempts > VERIFY_RETRIES:
+                    raise
+                timer.retries += 1
+                # The tablet may have saved the file since it was summed
+                checksums = self._remote_checksums([remote_file])
+                with self._lock:
+                    self.checksums.update(checksums)
+                expected = checksums.get(remote_file.path)
+        if self.hashes is not None:
+            self.hashes.record(
+                os.path.join(self.local_directory, remote_file.path), checksum
+            )
+
+
+def remove_stale(local_directory, paths):
+    """Delete local copies of files the tablet no longer has"""
+    for path in paths:
+        local_path = os.path.join(local_directory, path)
+        if os.path.isfile(local_path):
+            os.remove(local_path)
+        parent = os.path.dirname(local_path)
+        while (os.path.normpath(parent) != os.path.normpath(local_directory)
+               and os.path.isdir(parent) and not os.listdir(parent)):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+
+def pull(connection, remote_directory, local_directory, manifest,
+         workers=WORKERS, status=None, stopped=None, tree=None, landed=None,
+         planned=None, throttle=None, window=WINDOW, hashes=None):
+    """Fetch new and changed files, drop removed ones, return the counts"""
+    if tree is None:
+        tree = list_tree(connection, remote_directory)
+    if stopped and stopped():
+        return 0, 0, 0
+    for entry in tree.dirs():
+        local_path = os.path.join(local_directory, entry.path)
+        if not os.path.exists(local_path):
+            os.makedirs(local_path)
+    fetch, unchanged, stale = manifest.plan(tree.files(), local_directory)
+    if planned:
+        planned(len(fetch), sum(remote_file.size for remote_file in fetch))
+    fetched = []
+
+    def done(remote_file):
+        """Record each file as soon as it is safely on disk"""
+        manifest.update(remote_file)
+        fetched.append(remote_file)
+        if len(fetched) % SAVE_EVERY == 0:
+            manifest.save()
+        if landed:
+            landed(remote_file)
+
+    downloader = Downloader(
+        connection,
+        remote_directory,
+        local_directory,
+        workers=workers,
+        status=status,
+        stopped=stopped,
+        throttle=throttle,
+        window=window,
+        hashes=hashes
+    )
+    try:
+        downloader.run(fetch, done)
+    finally:
+        manifest.save()
+    removed = 0
+    if not (stopped and stopped()):
+        remove_stale(local_directory, stale)
+        for path in stale:
+            manifest.remove(path)
+        removed = len(stale)
+        manifest.save()
+    return len(fetched), len(unchanged), removed
+
+
+class CountingReader(object):
+    """File-like wrapper that counts the bytes read through it"""
+
+    def __init__(self, stream, throttle=None):
+        """Initialize the class"""
+        self.stream = stream
+        self.throttle = throttle
+        self.bytes = 0
+
+    def read(self, size=-1):
+        """Read from the stream and count it"""
+        data = self.stream.read(size)
+        self.bytes += len(data)
+        # The channel window backs up to the tablet when reads slow down
+        if self.throttle is not None:
+            self.throttle.take(len(data))
+        return data
+
+
+def tar_command(remote_directory, compress=False):
+    """Tar up remote_directory to stdout, members start with its name"""
+    parent, name = posixpath.split(remote_directory.rstrip('/'))
+    # One run of archives per pull class, back to back, in priority order
+    command = 'cd %s && %s' % (quote(parent), ' && '.join(
+        TAR_CLASS % (quote(name), tests) for tests in FIND_CLASSES
+    ))
+    if not compress:
+        return command
+    # gzip would hide a failed tar, so tar's exit status goes to stderr
+    return '{ { %s; } 2>/dev/null; echo $? >&2; } | gzip -1 -c' % command
+
+
+def _member_path(member, prefix):
+    """Path of a tar member relative to the pulled directory, or None"""
+    name = member.name
+    if name.startswith('./'):
+        name = name[2:]
+    if name == prefix.rstrip('/') or not name.startswith(prefix):
+        return None
+    path = name[len(prefix):]
+    if not path or posixpath.isabs(path) or '..' in path.split('/'):
+        return None
+    return path
+
+
+def _extract(archive, member, local_path):
+    """Write one member out through a .part file, return its md5"""
+    temp_path = part_path(local_path)
+    digest = hashlib.md5()
+    source = archive.extractfile(member)
+    try:
+        with open(temp_path, 'wb') as output:
+            for chunk in iter(lambda: source.read(CHUNK), b''):
+                output.write(chunk)
+                digest.update(chunk)
+        os.utime(temp_path, (member.mtime, member.mtime))
+        os.replace(temp_path, local_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+    return digest.hexdigest()
+
+
+def tar_pull(connection, remote_directory, local_directory, manifest,
+             status=None, stopped=None, landed=None, compress=False,
+             throttle=None, hashes=None):
+    """Stream one remote tar into local_directory, None means fall back"""
+    if compress and connection.run(GZIP_CHECK)[0] != 0:
+        compress = False
+    if not compress and connection.run(TAR_CHECK)[0] != 0:
+        return None
+    prefix = posixpath.basename(remote_directory.rstrip('/')) + '/'
+    started = time.time()
+    channel = connection.exec_command(
+        tar_command(remote_directory, compress)
+    )
+    reader = CountingReader(channel.makefile('rb'), throttle)
+    seen = set()
+    entries = 0
+    complete = False
+    try:
+        archive = tarfile.open(
+            fileobj=reader, mode='r|gz' if compress else 'r|',
+            ignore_zeros=True
+        )
+        for member in archive:
+            if stopped and stopped():
+                break
+            path = _member_path(member, prefix)
+            if path is None:
+                continue
+            local_path = os.path.join(local_directory, path)
+            if member.isdir():
+                if not os.path.exists(local_path):
+                    os.makedirs(local_path)
+            elif member.isfile():
+                parent = os.path.dirname(local_path)
+                if not os.path.exists(parent):
+                    os.makedirs(parent)
+                checksum = _extract(archive, member, local_path)
+                if hashes is not None:
+                    hashes.record(local_path, checksum)
+                mtime = int(member.mtime)
+                entry = RemoteEntry(path, False, member.size, mtime)
+                manifest.update(entry)
+                seen.add(path)
+                if landed:
+                    landed(entry)
+            entries += 1
+            if status:
+                status(path, entries, reader.bytes)
+        else:
+            complete = channel.recv_exit_status() == 0
+            if compress:
+                tar_status = channel.makefile_stderr('rb').read().strip()
+                complete = complete and tar_status == b'0'
+    except (tarfile.TarError, EOFError):
+        complete = False
+    finally:
+        channel.close()
+        manifest.save()
+        connection.metrics.record(
+            TAR,
+            reader.bytes,
+            time.time() - started,
+            error=None if complete else 'incomplete',
+            path=remote_directory,
+            compressed=compress
+        )
+    if not complete:
+        if stopped and stopped():
+            return entries, reader.bytes
+        return None
+    stale = [path for path in manifest.paths() if path not in seen]
+    remove_stale(local_directory, stale)
+    for path in stale:
+        manifest.remove(path)
+    manifest.save()
+    return entries, reader.bytes
+
+
+def verify(connection, remote_directory, local_directory, manifest,
+           status=None, stopped=None):
+    """(checked, paths that differ), those are dropped from the manifest so
+    the next pull fetches them again"""
+    files = []
+    for path in sorted(manifest.paths()):
+        size, mtime = manifest.entries.get(path, (0, 0))
+        files.append(RemoteEntry(path, False, size, mtime))
+    prefix = remote_directory + '/'
+    differ = []
+    checked = 0
+    # A batch at a time, so checking starts at once and can be stopped
+    for batch in sum_batches(files):
+        if stopped and stopped():
+            break
+        if status:
+            status(batch[0].path, checked, len(files))
+        checksums = remote_checksums(
+            connection, [prefix + remote_file.path for remote_file in batch]
+        )
+        for remote_file in batch:
+            if stopped and stopped():
+                break
+            expected = checksums.get(prefix + remote_file.path)
+            # Gone from the tablet, the next pull removes it anyway
+            if expected is None:
+                continue
+            if status:
+                status(remote_file.path, checked, len(files))
+            local_path = os.path.join(local_directory, remote_file.path)
+            if not os.path.isfile(local_path) or \
+                    file_md5(local_path) != expected:
+                differ.append(remote_file.path)
+            checked += 1
+    for path in differ:
+        manifest.remove(path)
+    manifest.save()
+    return checked, differ
+
+
+def new_documents(connection, remote_directory, manifest):
+    """uuids the tablet has that were never pulled, one listdir round trip"""
+    with connection.metrics.timer(LISTING, path=remote_directory):
+        names = connection.call(lambda sftp: sftp.listdir(remote_directory))
+    return set(
+        name[:-len('.metadata')] for name in names
+        if name.endswith('.metadata') and name not in manifest.entries
+    )
+
+
+def fetch_documents(connection, remote_directory, local_directory, manifest,
+                    doc_uuids, landed=None, hashes=None):
+    """Pull just the files of a few documents, return how many landed"""
+    paths = []
+    for doc_uuid in doc_uuids:
+        paths.extend(doc_uuid + extension for extension in DOCUMENT_FILES)
+    if not paths:
+        return 0
+    tree = list_paths(connection, remote_directory, paths)
+    for entry in tree.dirs():
+        local_path = os.path.join(local_directory, entry.path)
+        if not os.path.exists(local_path):
+            os.makedirs(local_path)
+    fetched = []
+
+    def done(remote_file):
+        """Record each file as soon as it is safely on disk"""
+        manifest.update(remote_file)
+        fetched.append(remote_file)
+        if landed:
+            landed(remote_file)
+
+    # The metadata goes in a run of its own after everything else so the
+    # document shows up complete, one run would fetch it first
+    files = [
+        entry for entry in tree.files()
+        if not entry.path.endswith('.metadata')
+    ]
+    metadata = [
+        entry for entry in tree.files() if entry.path.endswith('.metadata')
+    ]
+    try:
+        for batch in (files, metadata):
+            Downloader(
+                connection, remote_directory, local_directory, hashes=hashes
+            ).run(batch, done)
+    finally:
+        manifest.save()
+    return len(fetched)
@@ -0,0 +1,382 @@
+"""Everything that talks to the tablet over ssh goes through here"""
+from collections import namedtuple
+from shlex import quote
+import socket
+import stat
+from threading import RLock
+import time
+
+import paramiko
+
+from metrics import CHECKSUMS
+from metrics import LISTING
+from metrics import Metrics
+
+KEEPALIVE = 15
+TIMEOUT = 5
+
+AUTO = 'auto'
+ON = 'on'
+OFF = 'off'
+COMPRESSION_MODES = (AUTO, ON, OFF)
+# Zeros, so measure before compression is on; USB does several times this
+PROBE = 'head -c %d /dev/zero'
+PROBE_BYTES = 512 * 1024
+SLOW_LINK = 4000000
+
+REMOTE_TEMPLATE_DIR = '/usr/share/remarkable/templates/'
+REMOTE_SPLASH_DIR = '/usr/share/remarkable/'
+REMOTE_DOC_DIR = '/home/root/.local/share/remarkable/xochitl'
+REMOTE_CONFIG_FILE = '/home/root/.config/remarkable/xochitl.conf'
+
+# GNU find prints type letters, busybox find falls back to stat's hex mode
+LIST_TREE = "cd %s && (find %s -printf '%%y %%s %%T@ %%p\\n' 2>/dev/null || " \
+    "find %s -exec stat -c '%%f %%s %%Y %%n' {} + 2>/dev/null)"
+
+CHECKSUM_BATCH = 100
+
+RemoteEntry = namedtuple('RemoteEntry', 'path is_dir size mtime')
+
+# Errors that mean the link to the tablet went away (sleep, unplugged cable)
+LINK_ERRORS = (EOFError, socket.error, paramiko.ssh_exception.SSHException)
+
+
+class TabletConnection(object):
+    """One authenticated transport shared by every tablet operation"""
+
+    def __init__(self, host=None, port=22, username='root', password='',
+                 metrics=None, compression=OFF, timeout=None):
+        """Initialize the class, every transfer is timed into metrics
+
+        timeout bounds each connect and channel read, None waits forever
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.metrics = metrics or Metrics()
+        self.compression = compression
+        self.timeout = timeout
+        self.link_rate = None
+        self._compress = None
+        self._lock = RLock()
+        self._client = None
+        self._sftp = None
+
+    def configure(self, host, port, username, password, compression=None,
+                  timeout=None):
+        """Update the connection details, drop the transport if they moved"""
+        with self._lock:
+            port = int(port)
+            compression = compression or self.compression
+            if ((host, port, username, compression) !=
+                    (self.host, self.port, self.username, self.compression)):
+                self.close()
+                self.link_rate = None
+                self._compress = None
+            self.host = host
+            self.port = port
+            self.username = username
+            self.password = password
+            self.compression = compression
+            if timeout is not None:
+                self.timeout = timeout
+
+    def is_active(self):
+        """True when there is a live authenticated transport"""
+        with self._lock:
+            return bool(
+                self._client and
+                self._client.get_transport() and
+                self._client.get_transport().is_active()
+            )
+
+    def transport(self):
+        """Return the shared transport, (re)connecting if needed"""
+        with self._lock:
+            if not self.is_active():
+                self._connect()
+            return self._client.get_transport()
+
+    def _connect(self):
+        """Do the key exchange and password auth, measure the link if asked"""
+        self.close()
+        self._client = self._open_client(bool(self._compress))
+        if self.compression == AUTO and self._compress is None:
+            self.link_rate = probe(self._client.get_transport())
+            self._compress = self.link_rate < SLOW_LINK
+            if self._compress:
+                self.close()
+                self._client = self._open_client(True)
+
+    def _open_client(self, compress):
+        """One authenticated client"""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            timeout=self.timeout or TIMEOUT,
+            banner_timeout=self.timeout,
+            compress=compress or self.compression == ON
+        )
+        client.get_transport().set_keepalive(KEEPALIVE)
+        # Small sftp requests and exec scripts go out at once, Nagle would
+        # hold each one back for the ack of the last
+        client.get_transport().sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        return client
+
+    def wants_compression(self):
+        """True if compression is on, or auto and the link measured slow"""
+        return self.compression == ON or bool(self._compress)
+
+    def compressed(self):
+        """True if the transport negotiated compression of what comes back"""
+        transport = self.transport()
+        return transport.remote_compression not in (None, 'none')
+
+    def sftp(self):
+        """Shared sftp channel, reopened if the transport was replaced"""
+        with self._lock:
+            transport = self.transport()
+            channel = self._sftp.get_channel() if self._sftp else None
+            if (channel is None or channel.closed or
+                    channel.get_transport() is not transport):
+                self._sftp = paramiko.SFTPClient.from_transport(transport)
+                self._sftp.get_channel().settimeout(self.timeout)
+            return self._sftp
+
+    def open_sftp(self):
+        """A new sftp channel of its own on the shared transport"""
+        sftp = paramiko.SFTPClient.from_transport(self.transport())
+        sftp.get_channel().settimeout(self.timeout)
+        return sftp
+
+    def exec_command(self, command):
+        """Start command on a new exec channel and return the channel"""
+        channel = self.transport().open_session(timeout=self.timeout)
+        channel.settimeout(self.timeout)
+        channel.exec_command(command)
+        return channel
+
+    def run(self, command, stdin=None):
+        """Run command, return (exit status, stdout, stderr) as bytes"""
+        channel = self.exec_command(command)
+        try:
+            if stdin is not None:
+                channel.sendall(stdin)
+            channel.shutdown_write()
+            stdout = channel.makefile('rb').read()
+            stderr = channel.makefile_stderr('rb').read()
+            return channel.recv_exit_status(), stdout, stderr
+        finally:
+            channel.close()
+
+    def call(self, func, *args, **kwargs):
+        """Run func(sftp, ...) and retry once on a fresh link if it dropped"""
+        sftp = self.sftp()
+        try:
+            return func(sftp, *args, **kwargs)
+        except LINK_ERRORS:
+            if not dropped(sftp):
+                raise
+            return func(self.sftp(), *args, **kwargs)
+
+    def close(self):
+        """Shut down the sftp channel and the transport"""
+        with self._lock:
+            if self._sftp is not None:
+                try:
+                    self._sftp.close()
+                except LINK_ERRORS:
+                    pass
+                self._sftp = None
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+def dropped(sftp):
+    """True if the link under this channel went, not just the file failed"""
+    # Another thread may already have reconnected the shared transport, so
+    # ask the channel that failed rather than the connection
+    channel = sftp.get_channel()
+    return channel.closed or not channel.get_transport().is_active()
+
+
+def probe(transport, size=PROBE_BYTES):
+    """Bytes per second the tablet can send over an uncompressed transport"""
+    channel = transport.open_session()
+    try:
+        start = time.time()
+        channel.exec_command(PROBE % size)
+        received = 0
+        for chunk in iter(lambda: channel.recv(65536), b''):
+            received += len(chunk)
+        elapsed = time.time() - start
+    finally:
+        channel.close()
+    if elapsed <= 0 or received == 0:
+        return float('inf')
+    return received / elapsed
+
+
+class RemoteTree(object):
+    """In memory listing of everything under one remote directory"""
+
+    def __init__(self, entries=()):
+        """Initialize the class"""
+        self.entries = {}
+        self.children = {'': []}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """Add an entry, replacing any earlier one for the same path"""
+        if entry.path not in self.entries:
+            parent = entry.path.rpartition('/')[0]
+            self.children.setdefault(parent, []).append(entry.path)
+        if entry.is_dir:
+            self.children.setdefault(entry.path, [])
+        self.entries[entry.path] = entry
+
+    def get(self, path):
+        """The entry for path or None"""
+        return self.entries.get(path)
+
+    def listdir(self, path=''):
+        """Entries directly inside path"""
+        return [self.entries[child] for child in self.children.get(path, [])]
+
+    def files(self):
+        """Every file in the tree"""
+        return [entry for entry in self.entries.values() if not entry.is_dir]
+
+    def dirs(self):
+        """Every directory in the tree"""
+        return [entry for entry in self.entries.values() if entry.is_dir]
+
+    def documents(self):
+        """Document and collection uuids, one per .metadata file"""
+        return [
+            entry.path[:-len('.metadata')] for entry in self.listdir()
+            if entry.path.endswith('.metadata')
+        ]
+
+    def document_files(self, doc_uuid):
+        """Every file that belongs to one document"""
+        return [
+            entry for entry in self.files()
+            if entry.path.startswith(doc_uuid + '.') or
+            entry.path.startswith(doc_uuid + '/')
+        ]
+
+    def total_size(self):
+        """Bytes in all the files"""
+        return sum(entry.size for entry in self.files())
+
+
+def parse_tree(output):
+    """Build a RemoteTree out of the LIST_TREE output"""
+    tree = RemoteTree()
+    for line in output.decode('utf-8', 'replace').splitlines():
+        fields = line.split(' ', 3)
+        if len(fields) != 4:
+            continue
+        kind, size, mtime, path = fields
+        if path.startswith('./'):
+            path = path[2:]
+        if not path or path == '.':
+            continue
+        try:
+            if len(kind) == 1:
+                if kind not in 'df':
+                    continue
+                is_dir = kind == 'd'
+            else:
+                mode = int(kind, 16)
+                if not (stat.S_ISDIR(mode) or stat.S_ISREG(mode)):
+                    continue
+                is_dir = stat.S_ISDIR(mode)
+            tree.add(RemoteEntry(path, is_dir, int(size), int(float(mtime))))
+        except ValueError:
+            continue
+    return tree
+
+
+def walk_tree(sftp, remote_directory, tree=None, prefix=''):
+    """Build a RemoteTree one listdir_attr round trip per directory"""
+    if tree is None:
+        tree = RemoteTree()
+    for each in sftp.listdir_attr(remote_directory):
+        path = prefix + each.filename
+        is_dir = stat.S_ISDIR(each.st_mode)
+        tree.add(RemoteEntry(path, is_dir, each.st_size, int(each.st_mtime)))
+        if is_dir:
+            walk_tree(
+                sftp, remote_directory + '/' + each.filename, tree, path + '/'
+            )
+    return tree
+
+
+def tree_command(remote_directory, paths=('.',)):
+    """LIST_TREE for some paths relative to remote_directory"""
+    paths = ' '.join(quote(path) for path in paths)
+    return LIST_TREE % (quote(remote_directory), paths, paths)
+
+
+def list_tree(connection, remote_directory):
+    """The whole remote tree in one exec round trip, sftp walk if need be"""
+    with connection.metrics.timer(LISTING, path=remote_directory) as timer:
+        exit_status, output, _ = connection.run(
+            tree_command(remote_directory)
+        )
+        timer.bytes = len(output)
+        if exit_status == 0:
+            return parse_tree(output)
+        timer.retries = 1
+        return connection.call(walk_tree, remote_directory)
+
+
+def list_paths(connection, remote_directory, paths):
+    """RemoteTree of just the given paths, missing ones are left out"""
+    with connection.metrics.timer(LISTING, path=remote_directory) as timer:
+        _, output, _ = connection.run(tree_command(remote_directory, paths))
+        timer.bytes = len(output)
+    return parse_tree(output)
+
+
+def checksum_script(paths):
+    """Shell script that md5sums paths, a batch of arguments per line"""
+    lines = []
+    for start in range(0, len(paths), CHECKSUM_BATCH):
+        batch = paths[start:start + CHECKSUM_BATCH]
+        lines.append(
+            'md5sum ' + ' '.join(quote(path) for path in batch) +
+            ' 2>/dev/null'
+        )
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def parse_checksums(output):
+    """Map path -> md5 out of md5sum output"""
+    checksums = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        checksum, _, path = line.partition('  ')
+        if path:
+            checksums[path] = checksum
+    return checksums
+
+
+def remote_checksums(connection, paths):
+    """md5 of every remote path that exists, in one exec round trip"""
+    if not paths:
+        return {}
+    with connection.metrics.timer(CHECKSUMS, files=len(paths)) as timer:
+        _, output, _ = connection.run('sh -s', stdin=checksum_script(paths))
+        timer.bytes = len(output)
+    return parse_checksums(output)
@@ -0,0 +1,95 @@
+"""Shrink document thumbnails once, off the UI thread, and keep them around"""
+from collections import OrderedDict
+import hashlib
+import os
+from queue import LifoQueue
+from threading import Lock
+from threading import Thread
+
+from PIL import Image
+
+THUMB_SIZE = (300, 300)
+MEMORY = 64 * 1024 * 1024
+
+
+class LRUCache(object):
+    """Least recently used cache bounded by the bytes of what it holds"""
+
+    def __init__(self, max_bytes=MEMORY):
+        """Initialize the class"""
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """The cached value or None, marks it as recently used"""
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value, size):
+        """Cache value, evicting the oldest until it fits"""
+        with self._lock:
+            if key in self._items:
+                self.bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.bytes -= old_size
+
+
+class ThumbnailService(object):
+    """Decode and downscale on background workers, keep copies on disk"""
+
+    def __init__(self, cache_dir, deliver, workers=2):
+        """Initialize the class, deliver(source, size, rgba) gets results,
+        size and rgba are None for an image that can't be decoded"""
+        self.cache_dir = cache_dir
+        self.deliver = deliver
+        self._queue = LifoQueue()
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        for _ in range(workers):
+            thread = Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def request(self, source):
+        """Queue a thumbnail, the most recent requests go first"""
+        self._queue.put(source)
+
+    def cache_path(self, source):
+        """Downscaled copy on disk, keyed by the source path and mtime"""
+        mtime = os.stat(source).st_mtime
+        key = hashlib.sha1(
+            ('%s:%r' % (os.path.abspath(source), mtime)).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def _work(self):
+        """Worker loop"""
+        while True:
+            source = self._queue.get()
+            try:
+                size, pixels = self.load(source)
+            except (IOError, OSError):
+                size, pixels = None, None
+            self.deliver(source, size, pixels)
+
+    def load(self, source):
+        """(size, rgba bytes) from the disk cache or the original"""
+        cached = self.cache_path(source)
+        if os.path.exists(cached):
+            image = Image.open(cached)
+        else:
+            image = Image.open(source)
+            image.draft('RGB', THUMB_SIZE)
+            image.thumbnail(THUMB_SIZE)
+            image.save(cached + '.part', 'PNG')
+            os.replace(cached + '.part', cached)
+        image = image.convert('RGBA')
+        return image.size, image.tobytes()
@@ -0,0 +1,180 @@
+"""Queue documents for the tablet's web upload end point"""
+import mimetypes
+import os
+from queue import Queue
+from threading import Lock
+from threading import Thread
+import time
+import uuid
+
+import requests
+
+from metrics import HTTP_UPLOAD
+from metrics import Metrics
+
+UPLOAD_PATH = 'upload'
+DOCUMENTS_PATH = 'documents/'
+WORKERS = 2
+RETRIES = 3
+BACKOFF = 2
+READY_TIMEOUT = 120
+POLL_INTERVAL = 1
+CHUNK = 65536
+
+
+class MultipartStream(object):
+    """multipart/form-data body that reads the file as it is sent"""
+
+    def __init__(self, path, field='file', progress=None):
+        """Initialize the class, progress(sent, total) as it goes"""
+        boundary = uuid.uuid4().hex
+        content_type = mimetypes.guess_type(path)[0] or \
+            'application/octet-stream'
+        self.content_type = 'multipart/form-data; boundary=' + boundary
+        self.progress = progress
+        self._head = (
+            '--%s\r\n'
+            'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+            'Content-Type: %s\r\n\r\n' % (
+                boundary, field, os.path.basename(path), content_type
+            )
+        ).encode('utf-8')
+        self._tail = ('\r\n--%s--\r\n' % boundary).encode('utf-8')
+        self._file = open(path, 'rb')
+        self._size = os.path.getsize(path)
+        self.len = len(self._head) + self._size + len(self._tail)
+        self.sent = 0
+
+    def __len__(self):
+        """Lets requests send a Content-Length instead of chunking"""
+        return self.len
+
+    def read(self, size=CHUNK):
+        """Next piece of the body"""
+        if size is None or size < 0:
+            size = self.len
+        data = b''
+        if self.sent < len(self._head):
+            data = self._head[self.sent:self.sent + size]
+        if len(data) < size:
+            data += self._file.read(size - len(data))
+        if len(data) < size:
+            offset = self.sent + len(data) - len(self._head) - self._size
+            data += self._tail[offset:offset + size - len(data)]
+        self.sent += len(data)
+        if self.progress:
+            self.progress(self.sent, self.len)
+        return data
+
+    def close(self):
+        """Close the file"""
+        self._file.close()
+
+
+def document_ids(host, timeout=10):
+    """id -> visible name of what the tablet's web interface lists"""
+    response = requests.get(
+        'http://' + host + '/' + DOCUMENTS_PATH, timeout=timeout
+    )
+    response.raise_for_status()
+    return dict(
+        (document['ID'], document.get('VissibleName', ''))
+        for document in response.json()
+    )
+
+
+def wait_until_ready(host, name, known, timeout=READY_TIMEOUT):
+    """Poll until a new document called name shows up, return its id"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for doc_id, visible_name in document_ids(host).items():
+            if doc_id not in known and visible_name == name:
+                return doc_id
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+class UploadQueue(object):
+    """Bounded pool of workers streaming dropped files to the tablet"""
+
+    def __init__(self, workers=WORKERS, retries=RETRIES,
+                 progress=None, finished=None, metrics=None):
+        """Initialize the class, finished(path, doc_id, error) per file"""
+        self.retries = retries
+        self.metrics = metrics or Metrics()
+        self.progress = progress
+        self.finished = finished
+        self._queue = Queue()
+        self._lock = Lock()
+        self._pending = 0
+        for _ in range(workers):
+            thread = Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def add(self, path, host):
+        """Queue a file for the tablet at host"""
+        with self._lock:
+            self._pending += 1
+        self._queue.put((path, host))
+
+    def idle(self):
+        """True when nothing is queued or uploading"""
+        with self._lock:
+            return self._pending == 0
+
+    def _work(self):
+        """Worker loop"""
+        while True:
+            path, host = self._queue.get()
+            doc_id = None
+            error = None
+            try:
+                doc_id = self.upload(path, host)
+            except (IOError, ValueError) as upload_e:
+                error = upload_e
+            # Only idle once finished() has fetched the document back
+            try:
+                if self.finished:
+                    self.finished(path, doc_id, error)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def upload(self, path, host):
+        """Send one file, retrying with backoff, and wait for the tablet"""
+        name = os.path.splitext(os.path.basename(path))[0]
+        known = document_ids(host)
+        with self.metrics.timer(HTTP_UPLOAD, path=path) as timer:
+            timer.bytes = os.path.getsize(path)
+            for attempt in range(self.retries):
+                timer.retries = attempt
+                try:
+                    self._post(path, host)
+                    break
+                except requests.RequestException:
+                    if attempt == self.retries - 1:
+                        raise
+                    time.sleep(BACKOFF ** attempt)
+        return wait_until_ready(host, name, known)
+
+    def _post(self, path, host):
+        """Stream the multipart body from disk"""
+        def progress(sent, total):
+            """Tag the progress with the file"""
+            if self.progress:
+                self.progress(path, sent, total)
+
+        body = MultipartStream(path, progress=progress)
+        try:
+            response = requests.post(
+                'http://' + host + '/' + UPLOAD_PATH,
+                data=body,
+                headers={
+                    'Content-Type': body.content_type,
+                    'Content-Length': str(body.len)
+                }
+            )
+            response.raise_for_status()
+        finally:
+            body.close()
@@ -0,0 +1,134 @@
+"""MetadataIndex search and CollectionTree's in place updates"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+from library import COLLECTION  # noqa: E402
+from library import CollectionTree  # noqa: E402
+from library import MetadataIndex  # noqa: E402
+
+# uuid -> (.metadata, .content)
+DOCUMENTS = {
+    'paper': (
+        {'visibleName': 'Quantum Notes', 'type': 'DocumentType'},
+        {'fileType': 'pdf', 'tags': ['work'],
+         'documentMetadata': {'title': 'Entanglement', 'authors': ['Bell']}}
+    ),
+    'sketch': (
+        {'visibleName': 'Antiquarian sketches', 'type': 'DocumentType'},
+        {'fileType': 'notebook', 'pageCount': 12,
+         'tags': [{'name': 'Home'}]}
+    ),
+    'folder': (
+        {'visibleName': 'Quarterly', 'type': COLLECTION},
+        {}
+    ),
+}
+
+
+def metadata(key, name, parent='', kind='DocumentType'):
+    """A metadata dict the way the index hands them out"""
+    return {'uuid': key, 'visibleName': name, 'parent': parent, 'type': kind}
+
+
+class MetadataIndexTest(unittest.TestCase):
+    """Token search over names, titles, authors, tags and fields"""
+
+    def setUp(self):
+        """Index a small backup"""
+        self.root = tempfile.mkdtemp(prefix='remark-test-')
+        for key, (meta, content) in DOCUMENTS.items():
+            for extension, value in (('metadata', meta), ('content', content)):
+                path = os.path.join(self.root, key + '.' + extension)
+                with open(path, 'w') as document_file:
+                    json.dump(value, document_file)
+        self.index = MetadataIndex(os.path.join(self.root, 'index.sqlite'))
+        self.index.scan(self.root)
+
+    def tearDown(self):
+        """Clean up"""
+        self.index.close()
+        shutil.rmtree(self.root)
+
+    def test_prefix_matches_first(self):
+        """quar starts Quarterly and sits inside Antiquarian"""
+        self.assertEqual(self.index.search('quar'), ['folder', 'sketch'])
+
+    def test_every_term_must_match(self):
+        """Terms narrow the results down"""
+        self.assertEqual(self.index.search('quar home'), ['sketch'])
+        self.assertEqual(self.index.search('qua notes'), ['paper'])
+        self.assertEqual(self.index.search('quantum home'), [])
+
+    def test_titles_authors_and_fields(self):
+        """Content fields are searchable too"""
+        self.assertEqual(self.index.search('entangle'), ['paper'])
+        self.assertEqual(self.index.search('bell'), ['paper'])
+        self.assertEqual(self.index.search('type:pdf'), ['paper'])
+        self.assertEqual(self.index.search('tag:home'), ['sketch'])
+        self.assertEqual(self.index.search('pages:12'), ['sketch'])
+        self.assertEqual(self.index.search('type:folder'), ['folder'])
+
+    def test_nothing_to_search(self):
+        """Blank or punctuation only queries find nothing"""
+        self.assertEqual(self.index.search(''), [])
+        self.assertEqual(self.index.search('  - '), [])
+
+    def test_limit(self):
+        """Only the best matches come back"""
+        self.assertEqual(self.index.search('a', limit=1), ['sketch'])
+
+
+class CollectionTreeTest(unittest.TestCase):
+    """update() keeps every collection sorted without a rebuild"""
+
+    def setUp(self):
+        """An empty tree"""
+        self.tree = CollectionTree()
+
+    def names(self, parent=''):
+        """Visible names inside parent, as children() orders them"""
+        return [
+            child['visibleName'] for child in self.tree.children(parent)
+        ]
+
+    def test_insert_sorted_folders_first(self):
+        """Case insensitive names, folders ahead of documents"""
+        self.tree.update(metadata('b', 'beta'))
+        self.tree.update(metadata('a', 'Alpha'))
+        self.tree.update(metadata('z', 'zeta', kind=COLLECTION))
+        self.assertEqual(self.names(), ['zeta', 'Alpha', 'beta'])
+
+    def test_rename_and_move(self):
+        """A changed document leaves its old place"""
+        self.tree.update(metadata('a', 'Alpha'))
+        self.tree.update(metadata('b', 'beta'))
+        self.tree.update(metadata('a', 'omega'))
+        self.assertEqual(self.names(), ['beta', 'omega'])
+        self.tree.update(metadata('a', 'omega', parent='folder'))
+        self.assertEqual(self.names(), ['beta'])
+        self.assertEqual(self.names('folder'), ['omega'])
+
+    def test_same_name_and_thumbnails(self):
+        """Ties break on uuid, removing one leaves the other"""
+        self.tree.update(metadata('b', 'Same'), thumbnail='b.thumbnails/0')
+        self.tree.update(metadata('a', 'Same'))
+        self.assertEqual(
+            [child['uuid'] for child in self.tree.children('')], ['a', 'b']
+        )
+        self.assertEqual(self.tree.thumbnails, {'b': 'b.thumbnails/0'})
+        self.tree.remove('b')
+        self.assertEqual(
+            [child['uuid'] for child in self.tree.children('')], ['a']
+        )
+        self.assertEqual(self.tree.thumbnails, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
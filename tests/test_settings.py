@@ -0,0 +1,65 @@
+"""IniFile reads and edits only the exact keys it is asked for"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+from settings import IDLE_KEY  # noqa: E402
+from settings import IniFile  # noqa: E402
+
+CONFIG = '''[General]
+IdleSuspendDelayX=5
+IdleSuspendDelay=30
+SuspendPowerOffDelay=120
+
+[Other]
+IdleSuspendDelay=99
+'''
+
+
+class IniFileTest(unittest.TestCase):
+    """Exact key matching and minimal rewrites"""
+
+    def test_get_ignores_longer_keys(self):
+        """IdleSuspendDelayX is not IdleSuspendDelay"""
+        self.assertEqual(IniFile(CONFIG).get(IDLE_KEY), '30')
+
+    def test_get_ignores_other_sections(self):
+        """Only [General] is read by default"""
+        config = IniFile('[Other]\nIdleSuspendDelay=99\n')
+        self.assertIsNone(config.get(IDLE_KEY))
+
+    def test_set_leaves_longer_keys_alone(self):
+        """Changing the value rewrites just its own line"""
+        config = IniFile(CONFIG)
+        self.assertTrue(config.set(IDLE_KEY, 45))
+        self.assertEqual(
+            config.text(), CONFIG.replace('Delay=30', 'Delay=45')
+        )
+        self.assertTrue(config.dirty)
+
+    def test_set_adds_missing_key_next_to_prefixed_one(self):
+        """A key that only exists as a prefix is added, not overwritten"""
+        config = IniFile('[General]\nIdleSuspendDelayX=5\n')
+        config.set(IDLE_KEY, 30)
+        self.assertEqual(config.get('IdleSuspendDelayX'), '5')
+        self.assertEqual(config.get(IDLE_KEY), '30')
+
+    def test_set_same_value_is_not_dirty(self):
+        """Nothing to write back"""
+        config = IniFile(CONFIG)
+        self.assertFalse(config.set(IDLE_KEY, '30'))
+        self.assertFalse(config.dirty)
+        self.assertEqual(config.text(), CONFIG)
+
+    def test_set_creates_missing_section(self):
+        """An empty file gets [General] and the key"""
+        config = IniFile('')
+        config.set(IDLE_KEY, 30)
+        self.assertEqual(config.text(), '[General]\nIdleSuspendDelay=30\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
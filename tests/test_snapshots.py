@@ -0,0 +1,88 @@
+"""SnapshotStore keeps each file once and rebuilds any snapshot"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+from snapshots import SnapshotStore  # noqa: E402
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    """take, diff and restore against a small backup"""
+
+    def setUp(self):
+        """A backup with a document and a page"""
+        self.root = tempfile.mkdtemp(prefix='remark-test-')
+        self.backup = os.path.join(self.root, 'myfiles')
+        self.store = SnapshotStore(os.path.join(self.root, 'snapshots'))
+        self.write('doc.metadata', b'{"visibleName": "Doc"}')
+        self.write('doc/page.rm', b'strokes')
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.root)
+
+    def write(self, path, data):
+        """Put a file in the backup the way pulls do, never in place"""
+        local_path = os.path.join(self.backup, path)
+        if not os.path.exists(os.path.dirname(local_path)):
+            os.makedirs(os.path.dirname(local_path))
+        with open(local_path + '.part', 'wb') as local_file:
+            local_file.write(data)
+        os.replace(local_path + '.part', local_path)
+
+    def take(self):
+        """Snapshot everything in the backup"""
+        paths = []
+        for directory, _, names in os.walk(self.backup):
+            for name in names:
+                paths.append(os.path.relpath(
+                    os.path.join(directory, name), self.backup
+                ).replace(os.sep, '/'))
+        return self.store.take(self.backup, paths)
+
+    def test_take_stores_each_file_once(self):
+        """Unchanged files cost nothing, an unchanged backup no snapshot"""
+        name, new_objects, new_bytes = self.take()
+        self.assertEqual((new_objects, new_bytes), (2, 29))
+        self.assertEqual(self.store.names(), [name])
+        self.assertEqual(self.take(), (None, 0, 0))
+        self.write('doc/page.rm', b'more strokes')
+        self.write('copy.metadata', b'{"visibleName": "Doc"}')
+        second, new_objects, _ = self.take()
+        self.assertEqual(new_objects, 1)
+        self.assertEqual(self.store.names(), [name, second])
+
+    def test_diff(self):
+        """Added, removed and changed paths"""
+        old = self.take()[0]
+        self.write('doc/page.rm', b'more strokes')
+        self.write('new.metadata', b'{}')
+        os.remove(os.path.join(self.backup, 'doc.metadata'))
+        new = self.take()[0]
+        self.assertEqual(
+            self.store.diff(old, new),
+            (['new.metadata'], ['doc.metadata'], ['doc/page.rm'])
+        )
+        self.assertRaises(KeyError, self.store.diff, old, 'missing')
+
+    def test_restore(self):
+        """An older snapshot comes back as it was, mtimes included"""
+        mtime = os.path.getmtime(os.path.join(self.backup, 'doc/page.rm'))
+        old = self.take()[0]
+        self.write('doc/page.rm', b'more strokes')
+        self.take()
+        target = os.path.join(self.root, 'restored')
+        self.assertEqual(self.store.restore(old, target), 2)
+        page = os.path.join(target, 'doc', 'page.rm')
+        with open(page, 'rb') as restored:
+            self.assertEqual(restored.read(), b'strokes')
+        self.assertEqual(os.path.getmtime(page), mtime)
+
+
+if __name__ == '__main__':
+    unittest.main()
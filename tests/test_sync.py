@@ -0,0 +1,157 @@
+"""Pull planning, stale removal, tar member paths and priority classes"""
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+import sync  # noqa: E402
+from tablet import RemoteEntry  # noqa: E402
+
+# Relative path -> size
+FILES = {
+    'doc.metadata': 10,
+    'doc.content': 10,
+    'doc.pagedata': 10,
+    'doc.thumbnails/0.jpg': 10,
+    'doc.thumbnails/huge.jpg': sync.LARGE + 1,
+    'doc/page.rm': 10,
+    'doc/edge.rm': sync.LARGE,
+    'doc/huge.rm': sync.LARGE + 1,
+    'book.pdf': 10,
+    'book.epub': 10,
+    'book.pdf.part': 10,
+}
+
+
+@unittest.skipIf(shutil.which('find') is None, 'needs find')
+class PriorityTest(unittest.TestCase):
+    """Every file lands in exactly one find class, the one priority() says"""
+
+    def setUp(self):
+        """Lay the files out, sparse so the large ones cost nothing"""
+        self.root = tempfile.mkdtemp(prefix='remark-test-')
+        for path, size in FILES.items():
+            local_path = os.path.join(self.root, path)
+            if not os.path.exists(os.path.dirname(local_path)):
+                os.makedirs(os.path.dirname(local_path))
+            with open(local_path, 'wb') as local_file:
+                local_file.truncate(size)
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.root)
+
+    def find(self, expression):
+        """Relative paths find matches with one class's tests"""
+        output = subprocess.check_output(
+            'cd %s && find . -type f %s' % (self.root, expression),
+            shell=True
+        )
+        return set(line[2:] for line in output.decode('utf-8').splitlines())
+
+    def test_classes_agree(self):
+        """Metadata, thumbnails, pages, then PDFs, EPUBs and large files"""
+        found = {}
+        for number, expression in enumerate(sync.FIND_CLASSES):
+            for path in self.find(expression):
+                self.assertNotIn(path, found)
+                found[path] = number
+        self.assertEqual(set(found), set(FILES))
+        for path, size in FILES.items():
+            entry = RemoteEntry(path, False, size, 0)
+            self.assertEqual(sync.priority(entry), found[path], path)
+
+
+class ManifestTest(unittest.TestCase):
+    """plan() fetches what changed and lists what the tablet dropped"""
+
+    def setUp(self):
+        """A backup of two files, both in the manifest"""
+        self.root = tempfile.mkdtemp(prefix='remark-test-')
+        self.manifest = sync.SyncManifest(
+            os.path.join(self.root, 'manifest.json')
+        )
+        self.backup = os.path.join(self.root, 'myfiles')
+        os.makedirs(os.path.join(self.backup, 'doc'))
+        for path in ('doc.metadata', 'doc/page.rm'):
+            with open(os.path.join(self.backup, path), 'wb') as local_file:
+                local_file.write(b'12345')
+            self.manifest.update(RemoteEntry(path, False, 5, 100))
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.root)
+
+    def test_plan(self):
+        """Unchanged, resized, new and removed files"""
+        remote = [
+            RemoteEntry('doc.metadata', False, 5, 100),
+            RemoteEntry('doc/page.rm', False, 6, 200),
+            RemoteEntry('new.metadata', False, 5, 100),
+        ]
+        fetch, unchanged, stale = self.manifest.plan(remote, self.backup)
+        self.assertEqual(
+            [entry.path for entry in fetch], ['doc/page.rm', 'new.metadata']
+        )
+        self.assertEqual([entry.path for entry in unchanged], ['doc.metadata'])
+        self.assertEqual(stale, [])
+        _, _, stale = self.manifest.plan(remote[:1], self.backup)
+        self.assertEqual(stale, ['doc/page.rm'])
+
+    def test_plan_fetches_missing_local_copy(self):
+        """A manifest entry alone doesn't make a file current"""
+        os.remove(os.path.join(self.backup, 'doc.metadata'))
+        fetch, _, _ = self.manifest.plan(
+            [RemoteEntry('doc.metadata', False, 5, 100)], self.backup
+        )
+        self.assertEqual([entry.path for entry in fetch], ['doc.metadata'])
+
+    def test_save_and_load(self):
+        """The manifest survives a restart"""
+        self.manifest.save()
+        loaded = sync.SyncManifest(self.manifest.path)
+        self.assertEqual(loaded.entries, self.manifest.entries)
+
+    def test_remove_stale(self):
+        """Stale files go, and so do the directories they leave empty"""
+        sync.remove_stale(self.backup, ['doc/page.rm', 'gone/never.rm'])
+        self.assertFalse(os.path.exists(os.path.join(self.backup, 'doc')))
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.backup, 'doc.metadata'))
+        )
+        self.assertTrue(os.path.isdir(self.backup))
+
+
+class MemberPathTest(unittest.TestCase):
+    """Tar members only ever land inside the backup"""
+
+    def path(self, name, prefix='xochitl/'):
+        """_member_path of a member called name"""
+        return sync._member_path(tarfile.TarInfo(name), prefix)
+
+    def test_inside(self):
+        """With and without a leading ./"""
+        self.assertEqual(self.path('xochitl/doc/page.rm'), 'doc/page.rm')
+        self.assertEqual(self.path('./xochitl/doc.metadata'), 'doc.metadata')
+
+    def test_outside(self):
+        """The directory itself and anything beside it are skipped"""
+        self.assertIsNone(self.path('xochitl'))
+        self.assertIsNone(self.path('xochitl/'))
+        self.assertIsNone(self.path('other/doc.metadata'))
+
+    def test_traversal(self):
+        """.. components and absolute paths are refused"""
+        self.assertIsNone(self.path('xochitl/../etc/passwd'))
+        self.assertIsNone(self.path('xochitl/doc/../../escape'))
+        self.assertIsNone(self.path('xochitl//etc/passwd'))
+
+
+if __name__ == '__main__':
+    unittest.main()
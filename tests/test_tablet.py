@@ -0,0 +1,58 @@
+"""parse_tree reads both the GNU find and the busybox stat listings"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+from tablet import RemoteEntry  # noqa: E402
+from tablet import parse_tree  # noqa: E402
+
+# find -printf '%y %s %T@ %p\n'
+GNU = b'''d 4096 1500000000.0000000000 .
+d 4096 1500000100.2500000000 ./abc
+f 120 1500000200.7500000000 ./abc.metadata
+f 3000 1500000300.0000000000 ./abc/page one.rm
+l 7 1500000400.0000000000 ./link
+'''
+# stat -c '%f %s %Y %n'
+BUSYBOX = b'''41ed 4096 1500000000 .
+41ed 4096 1500000100 ./abc
+81a4 120 1500000200 ./abc.metadata
+81a4 3000 1500000300 ./abc/page one.rm
+a1ff 7 1500000400 ./link
+'''
+EXPECTED = {
+    'abc': RemoteEntry('abc', True, 4096, 1500000100),
+    'abc.metadata': RemoteEntry('abc.metadata', False, 120, 1500000200),
+    'abc/page one.rm': RemoteEntry('abc/page one.rm', False, 3000, 1500000300),
+}
+
+
+class ParseTreeTest(unittest.TestCase):
+    """Both listings give the same tree"""
+
+    def test_gnu(self):
+        """find -printf, fractional mtimes, links skipped"""
+        self.assertEqual(parse_tree(GNU).entries, EXPECTED)
+
+    def test_busybox(self):
+        """stat -c with hex modes"""
+        self.assertEqual(parse_tree(BUSYBOX).entries, EXPECTED)
+
+    def test_children(self):
+        """Files hang off their directory"""
+        tree = parse_tree(BUSYBOX)
+        self.assertEqual(
+            [entry.path for entry in tree.listdir('abc')], ['abc/page one.rm']
+        )
+
+    def test_garbage_lines(self):
+        """Short lines, bad numbers and unknown kinds are skipped"""
+        output = b'f 12\nf x 1500000000 ./a\nzz 1 1 ./b\n\n' + GNU
+        self.assertEqual(parse_tree(output).entries, EXPECTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""MultipartStream sends the same body however it is read"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'src'))
+
+from uploads import MultipartStream  # noqa: E402
+
+DATA = bytes(range(256)) * 40
+
+
+class MultipartStreamTest(unittest.TestCase):
+    """read() walks the head, the file and the tail"""
+
+    def setUp(self):
+        """A PDF to send"""
+        self.root = tempfile.mkdtemp(prefix='remark-test-')
+        self.path = os.path.join(self.root, 'paper.pdf')
+        with open(self.path, 'wb') as pdf:
+            pdf.write(DATA)
+        self.progress = []
+
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.root)
+
+    def stream(self):
+        """A new stream over the PDF"""
+        stream = MultipartStream(
+            self.path,
+            progress=lambda sent, total: self.progress.append((sent, total))
+        )
+        self.addCleanup(stream.close)
+        return stream
+
+    def expected(self, stream):
+        """The whole body for this stream's boundary"""
+        boundary = stream.content_type.partition('boundary=')[2]
+        return (
+            b'--' + boundary.encode('utf-8') + b'\r\n'
+            b'Content-Disposition: form-data; name="file"; '
+            b'filename="paper.pdf"\r\n'
+            b'Content-Type: application/pdf\r\n\r\n' + DATA +
+            b'\r\n--' + boundary.encode('utf-8') + b'--\r\n'
+        )
+
+    def read_all(self, stream, size):
+        """Read until empty, size at a time"""
+        pieces = []
+        for piece in iter(lambda: stream.read(size), b''):
+            self.assertLessEqual(len(piece), size)
+            pieces.append(piece)
+        return b''.join(pieces)
+
+    def test_body(self):
+        """Boundary, headers, the file untouched, closing boundary"""
+        stream = self.stream()
+        body = stream.read(-1)
+        self.assertEqual(body, self.expected(stream))
+        self.assertEqual(len(stream), len(body))
+        self.assertEqual(stream.read(), b'')
+
+    def test_any_read_size(self):
+        """Reads that straddle the head, file and tail edges"""
+        for size in (1, 7, 100, 4096, len(self.stream()) - 1):
+            stream = self.stream()
+            self.assertEqual(
+                self.read_all(stream, size), self.expected(stream), size
+            )
+
+    def test_progress(self):
+        """Reported after every read, ending at the full length"""
+        stream = self.stream()
+        self.read_all(stream, 1000)
+        sent = [entry[0] for entry in self.progress]
+        self.assertEqual(sent, sorted(sent))
+        self.assertEqual(self.progress[-1], (len(stream), len(stream)))
+
+
+if __name__ == '__main__':
+    unittest.main()